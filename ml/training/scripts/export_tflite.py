@@ -12,18 +12,16 @@ from pathlib import Path
 
 import onnx
 import torch
-from model import MelCNN
+from models import load_checkpoint
+from optimize_inference import check_equivalence, fuse_melcnn
+from quantize import calibration_mels, configure_int8_converter
 
 
-def load_model(checkpoint: Path) -> MelCNN:
-    model = MelCNN()
-    state = torch.load(checkpoint, map_location="cpu")
-    model.load_state_dict(state)
-    model.eval()
-    return model
+def load_model(checkpoint: Path) -> torch.nn.Module:
+    return load_checkpoint(checkpoint)
 
 
-def export_onnx(model: MelCNN, onnx_path: Path, mel_bins: int, frames: int) -> None:
+def export_onnx(model: torch.nn.Module, onnx_path: Path, mel_bins: int, frames: int) -> None:
     dummy = torch.randn(1, 1, mel_bins, frames)
     dynamic_axes = {"mel": {0: "batch", 3: "frames"}, "logits": {0: "batch"}}
     torch.onnx.export(
@@ -37,7 +35,7 @@ def export_onnx(model: MelCNN, onnx_path: Path, mel_bins: int, frames: int) -> N
     )
 
 
-def export_tflite(onnx_path: Path, tflite_path: Path, quantize: bool) -> None:
+def export_tflite(onnx_path: Path, tflite_path: Path, quantize: bool, calibration: list | None = None) -> None:
     from onnx_tf.backend import prepare  # type: ignore
     import tensorflow as tf
 
@@ -46,7 +44,9 @@ def export_tflite(onnx_path: Path, tflite_path: Path, quantize: bool) -> None:
         tf_rep = prepare(onnx.load(str(onnx_path)))
         tf_rep.export_graph(str(saved_model_dir))
         converter = tf.lite.TFLiteConverter.from_saved_model(str(saved_model_dir))
-        if quantize:
+        if calibration:
+            configure_int8_converter(converter, calibration)
+        elif quantize:
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
         tflite_bytes = converter.convert()
         tflite_path.write_bytes(tflite_bytes)
@@ -60,17 +60,31 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--mel-bins", type=int, default=64)
     parser.add_argument("--frames", type=int, default=200, help="Time frames used for dummy export input")
     parser.add_argument("--quantize", action="store_true", help="Enable default int8 quantization")
+    parser.add_argument("--calibration-data", type=Path, default=None,
+                        help="real/ + fake/ WAV directory; with --quantize, calibrates full-integer int8")
+    parser.add_argument("--calibration-samples", type=int, default=256)
+    parser.add_argument("--no-fuse", action="store_true", help="Export without folding BatchNorm into the convs")
     return parser
 
 
-def main() -> None:
-    args = build_parser().parse_args()
+def export(args: argparse.Namespace) -> None:
     model = load_model(args.checkpoint)
+    if not args.no_fuse:
+        fused = fuse_melcnn(model)
+        print(f"Fused Conv-BN-ReLU (max logit diff {check_equivalence(model, fused):.2e})")
+        model = fused
     export_onnx(model, args.onnx_path, mel_bins=args.mel_bins, frames=args.frames)
-    export_tflite(args.onnx_path, args.tflite_path, quantize=args.quantize)
+    calibration = None
+    if args.quantize and args.calibration_data:
+        calibration = calibration_mels(args.calibration_data, args.calibration_samples)
+    export_tflite(args.onnx_path, args.tflite_path, quantize=args.quantize, calibration=calibration)
     print(f"ONNX saved to {args.onnx_path}")
     print(f"TFLite saved to {args.tflite_path}")
 
 
+def main() -> None:
+    export(build_parser().parse_args())
+
+
 if __name__ == "__main__":
     main()
@@ -1,50 +1,162 @@
 #!/usr/bin/env python3
 """
-Stage ASVspoof 5 metadata into data/raw/{real,fake} as 16 kHz mono WAV files.
+Stage ASVspoof 5 metadata into data/raw/{real,fake} as 16 kHz mono WAV files
+plus a columnar manifest (see src/manifest.py), or into tar shards for
+streaming training (--format shards).
 """
 
 from __future__ import annotations
 
 import argparse
+import io
+import json
 import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, Iterator, List, Tuple
 
+import torch
 import torchaudio
-from torchaudio.functional import resample
 from tqdm import tqdm
 
-LABEL_MAP = {
-    "bonafide": "real",
-    "genuine": "real",
-    "real": "real",
-    "spoof": "fake",
-    "fake": "fake",
-}
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
 
+import audio_io  # noqa: E402
+from manifest import Manifest  # noqa: E402
+from protocol import LABEL_MAP, parse_metadata  # noqa: E402
+from shards import ShardWriter  # noqa: E402
 
-def parse_metadata(path: Path) -> List[Dict[str, str]]:
-    entries: List[Dict[str, str]] = []
+CHECKPOINT_NAME = ".staging_checkpoint"
+
+
+def _init_worker() -> None:
+    # One process per core already; stop each worker from spawning its own pool.
+    torch.set_num_threads(1)
+
+
+def load_mono(src: Path, sample_rate: int) -> torch.Tensor:
+    return audio_io.load(src, sample_rate)
+
+
+def convert_file(src: Path, dst: Path, sample_rate: int) -> float:
+    """Convert ``src`` to a mono PCM16 WAV at ``dst``; returns the staged duration in seconds."""
+    waveform = load_mono(src, sample_rate)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    # Write next to the target and rename so an interrupted run never leaves a
+    # truncated file that looks up to date.
+    tmp = dst.with_name(f".{dst.stem}.tmp.wav")
+    torchaudio.save(str(tmp), waveform, sample_rate, encoding="PCM_S", bits_per_sample=16)
+    os.replace(tmp, dst)
+    return waveform.shape[1] / sample_rate
+
+
+def _is_current(src: Path, dst: Path) -> bool:
+    try:
+        return dst.stat().st_mtime >= src.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _staged_seconds(dst: Path) -> float:
+    info = audio_io.info(str(dst))
+    return info[0] / info[1]
+
+
+def _stage_task(task: Tuple[str, Path, Path, int]) -> Tuple[str, float, bool]:
+    """Returns (utt_id, staged seconds, whether it was converted now)."""
+    utt_id, src, dst, sample_rate = task
+    if _is_current(src, dst):
+        return utt_id, _staged_seconds(dst), False
+    return utt_id, convert_file(src, dst, sample_rate), True
+
+
+def _encode_task(task: Tuple[str, Path, Path, int]) -> Tuple[str, bytes, float]:
+    utt_id, src, _, sample_rate = task
+    waveform = load_mono(src, sample_rate)
+    buffer = io.BytesIO()
+    torchaudio.save(buffer, waveform, sample_rate, format="wav", encoding="PCM_S", bits_per_sample=16)
+    return utt_id, buffer.getvalue(), waveform.shape[1] / sample_rate
+
+
+def _run_tasks(fn, tasks: List, workers: int, desc: str) -> Iterator:
+    """Apply ``fn`` to ``tasks`` in order, across a process pool when ``workers > 1``."""
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+            try:
+                yield from tqdm(pool.map(fn, tasks, chunksize=chunksize), total=len(tasks), desc=desc)
+            finally:
+                pool.shutdown(cancel_futures=True)
+    else:
+        yield from tqdm(map(fn, tasks), total=len(tasks), desc=desc)
+
+
+def _log_throughput(subset: str, converted: int, audio_seconds: float, started: float, workers: int, detail: str) -> None:
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    logging.info(
+        "Staged %s: %d converted%s in %.1fs (%.1f files/s, %.1f audio-s/s, %d workers)",
+        subset,
+        converted,
+        detail,
+        elapsed,
+        converted / elapsed,
+        audio_seconds / elapsed,
+        workers,
+    )
+
+
+def write_shards(tasks: List[Tuple[str, Path, Path, int]], target_dir: Path, workers: int, shard_size: int) -> None:
+    """Encode ``tasks`` and pack them, with their labels, into tar shards under ``target_dir``."""
+    converted = 0
+    audio_seconds = 0.0
+    started = time.perf_counter()
+    labels = {task[0]: task[2].parent.name for task in tasks}
+    with ShardWriter(target_dir, max_count=shard_size) as writer:
+        for utt_id, audio, seconds in _run_tasks(_encode_task, tasks, workers, f"Sharding {target_dir.name}"):
+            label_name = labels[utt_id]
+            meta = {
+                "utt_id": utt_id,
+                "label": 0 if label_name == "real" else 1,
+                "label_name": label_name,
+                "sample_rate": tasks[0][3],
+                "seconds": seconds,
+            }
+            writer.write(utt_id, audio, meta)
+            converted += 1
+            audio_seconds += seconds
+    _log_throughput(target_dir.name, converted, audio_seconds, started, workers, f" into {len(writer.shards)} shards")
+
+
+def _load_checkpoint(path: Path, params: Dict[str, object]) -> Dict[str, float | None]:
+    """Return utt_ids completed by a previous run with the same parameters, with their staged seconds if recorded."""
+    if not path.exists():
+        return {}
+    done: Dict[str, float | None] = {}
     with path.open("r", encoding="utf-8") as handle:
+        header = handle.readline()
+        if not header or json.loads(header) != params:
+            return {}
         for line in handle:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            parts = line.split()
-            utt_id = next((token for token in parts if token.startswith("T_")), parts[0])
-            label = parts[-1].lower()
-            entries.append({"utt_id": utt_id, "label": label})
-    return entries
-
-
-def convert_file(src: Path, dst: Path, sample_rate: int) -> None:
-    waveform, sr = torchaudio.load(src)
-    if waveform.shape[0] > 1:
-        waveform = waveform.mean(dim=0, keepdim=True)
-    if sr != sample_rate:
-        waveform = resample(waveform, orig_freq=sr, new_freq=sample_rate)
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    torchaudio.save(str(dst), waveform, sample_rate, encoding="PCM_S", bits_per_sample=16)
+            fields = line.strip().split("\t")
+            if fields[0]:
+                done[fields[0]] = float(fields[1]) if len(fields) > 1 else None
+    return done
+
+
+def write_manifest(tasks: List[Tuple[str, Path, Path, int]], target_dir: Path, seconds: Dict[str, float]) -> None:
+    """Columnar manifest of the staged WAVs in metadata order."""
+    Manifest.write(
+        target_dir,
+        [task[2].relative_to(target_dir).as_posix() for task in tasks],
+        [0 if task[2].parent.name == "real" else 1 for task in tasks],
+        [seconds[task[0]] for task in tasks],
+        [task[3] for task in tasks],
+    )
 
 
 def stage_subset(
@@ -55,27 +167,73 @@ def stage_subset(
     sample_rate: int,
     extension: str,
     limit: int | None,
+    workers: int | None = None,
+    output_format: str = "wav",
+    shard_size: int = 2000,
 ) -> Dict[str, int]:
     stats = {"real": 0, "fake": 0, "skipped": 0}
     entries = parse_metadata(metadata_path)
     target_dir = output_root / subset
-    for entry in tqdm(entries, desc=f"Staging {subset}"):
+    available = {entry.name for entry in os.scandir(flac_root)} if flac_root.is_dir() else set()
+
+    # Select work up front so --limit and the stats match the serial behaviour.
+    tasks: List[Tuple[str, Path, Path, int]] = []
+    for entry in entries:
         label_token = entry["label"]
         label = LABEL_MAP.get(label_token)
         if label is None:
             logging.warning("Unknown label %s (line skipped)", label_token)
             stats["skipped"] += 1
             continue
-        src = flac_root / f"{entry['utt_id']}{extension}"
-        if not src.exists():
-            logging.warning("Missing file %s", src)
+        name = f"{entry['utt_id']}{extension}"
+        if name not in available:
+            logging.warning("Missing file %s", flac_root / name)
             stats["skipped"] += 1
             continue
         dst = target_dir / label / f"{entry['utt_id']}.wav"
-        convert_file(src, dst, sample_rate)
+        tasks.append((entry["utt_id"], flac_root / name, dst, sample_rate))
         stats[label] += 1
         if limit and stats["real"] + stats["fake"] >= limit:
             break
+
+    workers = workers or os.cpu_count() or 1
+    if output_format == "shards":
+        write_shards(tasks, target_dir, workers, shard_size)
+        return stats
+
+    checkpoint_path = target_dir / CHECKPOINT_NAME
+    params = {"flac_root": str(flac_root.resolve()), "sample_rate": sample_rate, "extension": extension}
+    done = _load_checkpoint(checkpoint_path, params)
+    pending = [task for task in tasks if not (task[0] in done and _is_current(task[1], task[2]))]
+    resumed = len(tasks) - len(pending)
+    if resumed:
+        logging.info("Resuming %s: %d files already staged", subset, resumed)
+
+    target_dir.mkdir(parents=True, exist_ok=True)
+    fresh = not done
+    converted = up_to_date = 0
+    audio_seconds = 0.0
+    started = time.perf_counter()
+    staged_seconds: Dict[str, float] = {}
+    with checkpoint_path.open("w" if fresh else "a", encoding="utf-8") as checkpoint:
+        if fresh:
+            checkpoint.write(json.dumps(params) + "\n")
+        for utt_id, seconds, was_converted in _run_tasks(_stage_task, pending, workers, f"Staging {subset}"):
+            if was_converted:
+                converted += 1
+                audio_seconds += seconds
+            else:
+                up_to_date += 1
+            staged_seconds[utt_id] = seconds
+            checkpoint.write(f"{utt_id}\t{seconds:.6f}\n")
+    _log_throughput(
+        subset, converted, audio_seconds, started, workers, f", {up_to_date} up to date, {resumed} resumed"
+    )
+    for utt_id, src, dst, _ in tasks:
+        if utt_id not in staged_seconds:
+            recorded = done.get(utt_id)
+            staged_seconds[utt_id] = recorded if recorded is not None else _staged_seconds(dst)
+    write_manifest(tasks, target_dir, staged_seconds)
     return stats
 
 
@@ -88,6 +246,10 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--sample-rate", type=int, default=16000)
     parser.add_argument("--extension", default=".flac")
     parser.add_argument("--limit", type=int, default=None, help="Optional cap on number of files")
+    parser.add_argument("--workers", type=int, default=None, help="Conversion processes (default: CPU count)")
+    parser.add_argument("--format", choices=["wav", "shards"], default="wav",
+                        help="Write individual WAVs under real/fake, or tar shards with labels packed in")
+    parser.add_argument("--shard-size", type=int, default=2000, help="Clips per shard in --format shards")
     parser.add_argument("--log-level", default="INFO")
     return parser
 
@@ -103,6 +265,9 @@ def main() -> None:
         sample_rate=args.sample_rate,
         extension=args.extension,
         limit=args.limit,
+        workers=args.workers,
+        output_format=args.format,
+        shard_size=args.shard_size,
     )
     logging.info("Staged %s subset: %s", args.subset, stats)
 
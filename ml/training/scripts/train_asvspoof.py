@@ -1,86 +1,205 @@
 #!/usr/bin/env python3
 """
 End-to-end utility to (1) stage ASVspoof audio, (2) train MelCNN, (3) export TFLite.
+
+Each stage runs in-process and is fingerprinted from its inputs and settings
+(metadata file, staged manifest, checkpoint contents, CLI options). The
+fingerprints and the digests of each stage's outputs are recorded in
+``<work-dir>/pipeline_state.json``; a stage whose fingerprint matches and
+whose outputs are unchanged is skipped. Changing only export options
+re-runs only the export, and an interrupted training run resumes from its
+last epoch checkpoint. Extra train.py options can follow ``--``:
+
+    python train_asvspoof.py --metadata meta.txt --flac-root flac/ -- --loss focal --vad
 """
 
 from __future__ import annotations
 
 import argparse
-import subprocess
-import sys
+import hashlib
+import json
+import os
+import shutil
 from pathlib import Path
+from typing import Callable, Dict, Iterable, List
+
+import torch
+
+from split_asvspoof import stage_subset  # also puts src/ on sys.path
 
-from split_asvspoof import stage_subset
+from checkpoint import latest_checkpoint
+from export_tflite import build_parser as build_export_parser, export
+from manifest import MANIFEST_DIR, Manifest
+from train import build_parser as build_train_parser, train
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
+STATE_NAME = "pipeline_state.json"
+STAGES = ("stage", "train", "export")
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(**parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def manifest_files(split_dir: Path) -> List[Path]:
+    """The files that identify a staged split: its manifest (paths, labels, durations)."""
+    return sorted((split_dir / MANIFEST_DIR).iterdir()) if Manifest.exists(split_dir) else []
+
+
+def resumable_checkpoint(directory: Path) -> List[str]:
+    """``--resume`` arguments for the newest checkpoint in ``directory`` if its run is unfinished, else none."""
+    path = latest_checkpoint(directory) if directory.is_dir() else None
+    if path is None or torch.load(path, map_location="cpu", weights_only=False)["finished"]:
+        return []
+    return ["--resume", str(directory)]
+
+
+class PipelineState:
+    """Per-stage fingerprint and output digests, persisted after every completed stage."""
 
+    def __init__(self, path: Path):
+        self.path = path
+        self.stages: Dict[str, Dict] = json.loads(path.read_text()) if path.exists() else {}
 
-def run_python(script: Path, extra_args: list[str]) -> None:
-    cmd = [sys.executable, str(script), *extra_args]
-    print(f"[run] {' '.join(cmd)}")
-    subprocess.run(cmd, cwd=str(REPO_ROOT), check=True)
+    def is_current(self, stage: str, key: str) -> bool:
+        entry = self.stages.get(stage)
+        if not entry or entry["fingerprint"] != key:
+            return False
+        return all(Path(p).exists() and file_digest(Path(p)) == d for p, d in entry["outputs"].items())
+
+    def record(self, stage: str, key: str, outputs: Iterable[Path]) -> None:
+        self.stages[stage] = {"fingerprint": key, "outputs": {str(p): file_digest(p) for p in outputs}}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        tmp.write_text(json.dumps(self.stages, indent=2))
+        os.replace(tmp, self.path)
+
+    def output_digest(self, stage: str) -> str:
+        return fingerprint(outputs=self.stages[stage]["outputs"])
+
+
+def run_stage(state: PipelineState, stage: str, key: str, force: bool, fn: Callable[[], Iterable[Path]]) -> None:
+    if not force and state.is_current(stage, key):
+        print(f"[{stage}] up to date ({key[:12]}), skipping")
+        return
+    print(f"[{stage}] running ({key[:12]})")
+    state.record(stage, key, fn())
 
 
 def build_parser() -> argparse.ArgumentParser:
-    parser = argparse.ArgumentParser(description=__doc__)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("--metadata", type=Path, required=True)
     parser.add_argument("--flac-root", type=Path, required=True)
     parser.add_argument("--subset", default="train")
+    parser.add_argument("--val-metadata", type=Path, default=None,
+                        help="Metadata for a separate validation subset (default: --val-split of the training data)")
+    parser.add_argument("--val-flac-root", type=Path, default=None, help="Defaults to --flac-root")
+    parser.add_argument("--val-subset", default="dev")
     parser.add_argument("--data-root", type=Path, default=Path("ml/training/data/raw"))
     parser.add_argument("--sample-rate", type=int, default=16000)
     parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Staging processes (default: CPU count)")
     parser.add_argument("--epochs", type=int, default=25)
     parser.add_argument("--batch", type=int, default=32)
     parser.add_argument("--lr", type=float, default=1e-3)
     parser.add_argument("--model-dir", type=Path, default=Path("ml/model"))
+    parser.add_argument("--work-dir", type=Path, default=Path("ml/training/experiments/asvspoof"),
+                        help="Pipeline state and training checkpoints")
     parser.add_argument("--quantize", action="store_true")
-    parser.add_argument("--skip-stage", action="store_true")
+    parser.add_argument("--skip-stage", action="store_true", help="Use the staged data as it is")
+    parser.add_argument("--force", nargs="+", choices=STAGES, default=[], help="Re-run these stages regardless")
     return parser
 
 
 def main() -> None:
-    args = build_parser().parse_args()
+    args, train_extra = build_parser().parse_known_args()
+    if train_extra[:1] == ["--"]:
+        train_extra = train_extra[1:]
     data_root = REPO_ROOT / args.data_root
-    if not args.skip_stage:
-        stats = stage_subset(
-            metadata_path=REPO_ROOT / args.metadata,
-            flac_root=REPO_ROOT / args.flac_root,
-            output_root=data_root.parent,
-            subset=args.subset,
+    model_dir = REPO_ROOT / args.model_dir
+    work_dir = REPO_ROOT / args.work_dir
+    state = PipelineState(work_dir / STATE_NAME)
+
+    subsets = [(args.subset, args.metadata, args.flac_root)]
+    if args.val_metadata:
+        subsets.append((args.val_subset, args.val_metadata, args.val_flac_root or args.flac_root))
+    for subset, metadata, flac_root in subsets:
+        metadata, flac_root, split_dir = REPO_ROOT / metadata, REPO_ROOT / flac_root, data_root / subset
+        if args.skip_stage:
+            continue
+        key = fingerprint(
+            metadata=file_digest(metadata),
+            flac_root=str(flac_root.resolve()),
+            flac_root_mtime=flac_root.stat().st_mtime_ns,
+            output=str(split_dir.resolve()),
             sample_rate=args.sample_rate,
-            extension=".flac",
             limit=args.limit,
         )
-        print(f"Staged audio: {stats}")
-    train_script = REPO_ROOT / "ml/training/src/train.py"
-    run_python(
-        train_script,
-        [
-            "--data",
-            str(data_root / args.subset),
-            "--epochs",
-            str(args.epochs),
-            "--batch",
-            str(args.batch),
-            "--lr",
-            str(args.lr),
-            "--out",
-            str(REPO_ROOT / args.model_dir),
-        ],
-    )
-    export_script = REPO_ROOT / "ml/training/src/export_tflite.py"
-    run_python(
-        export_script,
-        [
-            "--checkpoint",
-            str(REPO_ROOT / args.model_dir / "melcnn.pt"),
-            "--onnx-path",
-            str(REPO_ROOT / args.model_dir / "melcnn.onnx"),
-            "--tflite-path",
-            str(REPO_ROOT / args.model_dir / "melcnn.tflite"),
-            "--quantize" if args.quantize else "",
-        ],
-    )
+
+        def stage(metadata=metadata, flac_root=flac_root, subset=subset, split_dir=split_dir):
+            stats = stage_subset(
+                metadata_path=metadata,
+                flac_root=flac_root,
+                output_root=data_root,
+                subset=subset,
+                sample_rate=args.sample_rate,
+                extension=".flac",
+                limit=args.limit,
+                workers=args.workers,
+            )
+            print(f"Staged audio: {stats}")
+            return manifest_files(split_dir)
+
+        run_stage(state, f"stage:{subset}", key, "stage" in args.force, stage)
+
+    train_dir, val_dir = data_root / args.subset, data_root / args.val_subset if args.val_metadata else None
+    train_argv = [
+        "--train-data", str(train_dir),
+        "--epochs", str(args.epochs),
+        "--batch", str(args.batch),
+        "--lr", str(args.lr),
+        *train_extra,
+    ]
+    data_key = {str(p): file_digest(p) for split in (train_dir, val_dir) if split for p in manifest_files(split)}
+    train_key = fingerprint(data=data_key, argv=train_argv, val=str(val_dir))
+
+    def train_stage():
+        # Checkpoints are kept per fingerprint, so a resumed run never picks up another configuration's state.
+        checkpoints = work_dir / "checkpoints" / train_key[:12]
+        resume = [] if "train" in args.force else resumable_checkpoint(checkpoints)
+        if not resume and checkpoints.exists():
+            # Forced, or a finished run whose melcnn.pt has since been replaced: train from scratch
+            shutil.rmtree(checkpoints)
+        train_args = build_train_parser().parse_args(train_argv + [
+            "--out", str(model_dir), "--checkpoint-dir", str(checkpoints), *resume,
+        ])
+        train_args.val_data = val_dir
+        summary = train(train_args)
+        print(f"Training finished: {summary}")
+        return [model_dir / "melcnn.pt"]
+
+    run_stage(state, "train", train_key, "train" in args.force, train_stage)
+
+    onnx_path, tflite_path = model_dir / "melcnn.onnx", model_dir / "melcnn.tflite"
+    export_argv = ["--checkpoint", str(model_dir / "melcnn.pt"), "--onnx-path", str(onnx_path),
+                   "--tflite-path", str(tflite_path)]
+    if args.quantize:
+        export_argv.append("--quantize")
+    export_key = fingerprint(checkpoint=state.output_digest("train"), argv=export_argv)
+
+    def export_stage():
+        export(build_export_parser().parse_args(export_argv))
+        return [onnx_path, tflite_path]
+
+    run_stage(state, "export", export_key, "export" in args.force, export_stage)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""
+Shared audio decoding for the training, preprocessing and staging paths.
+
+Everything goes through soundfile, is downmixed to mono and resampled with a
+cached ``Resample`` transform per (orig_sr, new_sr) pair, so the sinc kernel is
+built once per process instead of once per file. ``load_crop`` seeks to the
+requested window and decodes only that region (plus a small margin for the
+resampling filter), which is what the 3 s training crops need from long files.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from math import gcd
+from typing import Callable, Tuple
+
+import numpy as np
+import soundfile as sf
+import torch
+from torchaudio.transforms import Resample
+
+# Target-rate samples decoded on each side of a window; wider than the
+# resampling kernel for any common rate pair, so windows match a full decode.
+RESAMPLE_MARGIN = 64
+
+
+@lru_cache(maxsize=32)
+def get_resampler(orig_freq: int, new_freq: int) -> Resample:
+    return Resample(orig_freq=orig_freq, new_freq=new_freq)
+
+
+def resample(wav: torch.Tensor, orig_freq: int, new_freq: int) -> torch.Tensor:
+    if orig_freq == new_freq:
+        return wav
+    return get_resampler(orig_freq, new_freq)(wav)
+
+
+def _to_mono(data: np.ndarray) -> torch.Tensor:
+    """(frames, channels) float32 -> (1, frames) tensor; single-channel input is viewed, not copied."""
+    mono = data.reshape(-1) if data.shape[1] == 1 else data.mean(axis=1, dtype=np.float32)
+    return torch.from_numpy(mono).unsqueeze(0)
+
+
+def _read(handle: sf.SoundFile, start: int, frames: int) -> np.ndarray:
+    handle.seek(start)
+    return handle.read(frames, dtype="float32", always_2d=True)
+
+
+def resampled_length(frames: int, orig_freq: int, new_freq: int) -> int:
+    """Length of ``frames`` samples after resampling (same rounding as torchaudio)."""
+    return -(-frames * new_freq // orig_freq)
+
+
+def info(source) -> Tuple[int, int]:
+    """(frames, sample_rate) from the header only."""
+    meta = sf.info(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return meta.frames, meta.samplerate
+
+
+def load(source, sample_rate: int) -> torch.Tensor:
+    """Decode ``source`` (a path or file-like object) to a mono (1, n) float32 tensor at ``sample_rate``."""
+    data, sr = sf.read(source, dtype="float32", always_2d=True)
+    return resample(_to_mono(data), sr, sample_rate)
+
+
+def load_crop(source, sample_rate: int, length: int, choose_start: Callable[[int], int]) -> torch.Tensor:
+    """
+    Decode only a ``length``-sample window of ``source`` at ``sample_rate``.
+
+    ``choose_start`` gets the resampled file length and returns the window
+    start (it is not called for files shorter than ``length``, which are
+    returned whole for the caller to pad).
+    """
+    with sf.SoundFile(source) as handle:
+        sr, frames = handle.samplerate, handle.frames
+        total = resampled_length(frames, sr, sample_rate)
+        if total <= length:
+            return resample(_to_mono(_read(handle, 0, frames)), sr, sample_rate)
+        start = choose_start(total)
+        if sr == sample_rate:
+            return _to_mono(_read(handle, start, length))
+        # Start decoding on a sample where both rates line up so the resampled
+        # window lands on the same sample grid as a full-file resample.
+        g = gcd(sr, sample_rate)
+        src_block, dst_block = sr // g, sample_rate // g
+        first = max(start - RESAMPLE_MARGIN, 0) // dst_block
+        src_start = first * src_block
+        src_end = min(-(-(start + length + RESAMPLE_MARGIN) // dst_block) * src_block, frames)
+        wav = resample(_to_mono(_read(handle, src_start, src_end - src_start)), sr, sample_rate)
+        offset = start - first * dst_block
+        return wav[:, offset:offset + length]
@@ -0,0 +1,8 @@
+"""
+Performance benchmarks for the training/inference pipeline.
+
+Run from ``ml/training/src``:
+
+    python -m benchmarks run --out bench.json
+    python -m benchmarks compare baseline.json bench.json --tolerance 0.1
+"""
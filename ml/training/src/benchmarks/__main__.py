@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import torch
+
+from benchmarks import suites
+from benchmarks.synthetic import make_corpus
+from dataset import TARGET_FRAMES, DeepfakeDataset
+
+SUITES = ("decode", "features", "getitem", "multicrop", "dataloader", "train", "inference")
+
+
+def run(args) -> Dict:
+    selected = args.only or list(SUITES)
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = make_corpus(Path(tmp) / "corpus", clips=args.clips)
+        dataset = DeepfakeDataset(root)
+        for name in selected:
+            started = time.perf_counter()
+            if name == "decode":
+                results += suites.bench_decode(dataset, args.repeat)
+            elif name == "features":
+                results += suites.bench_features(dataset, args.repeat)
+            elif name == "getitem":
+                results += suites.bench_getitem(root, args.repeat)
+            elif name == "multicrop":
+                results += suites.bench_multicrop(root, args.repeat)
+            elif name == "dataloader":
+                results += suites.bench_dataloader(root, args.repeat, args.workers or suites.default_worker_counts())
+            elif name == "train":
+                results += suites.bench_train_step(args.repeat, args.batch_sizes, TARGET_FRAMES)
+            elif name == "inference":
+                results += suites.bench_inference(args.repeat, max(args.batch_sizes), TARGET_FRAMES, args.checkpoint)
+            print(f"[{name}] done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "machine": platform.machine(),
+            "threads": torch.get_num_threads(),
+            "clips": args.clips,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> Tuple[List[str], int]:
+    """Report lines for every shared metric plus the number worse than ``tolerance``."""
+    base = {r["name"]: r for r in baseline["results"]}
+    lines = []
+    regressions = 0
+    for entry in current["results"]:
+        ref = base.get(entry["name"])
+        if ref is None or not ref["value"]:
+            continue
+        change = entry["value"] / ref["value"] - 1.0
+        worse = -change if entry["higher_is_better"] else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif worse < -tolerance:
+            flag = "  improved"
+        lines.append(f"{entry['name']:32s} {ref['value']:10.3f} -> {entry['value']:10.3f} {entry['unit']:10s}"
+                     f" ({change:+.1%}){flag}")
+    lines.append(f"{regressions} regression(s) beyond {tolerance:.0%}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run benchmarks and write JSON results")
+    run_parser.add_argument("--out", type=Path, default=None, help="JSON output (default: stdout)")
+    run_parser.add_argument("--only", nargs="+", choices=SUITES, default=None)
+    run_parser.add_argument("--clips", type=int, default=32, help="Synthetic clips to generate")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    run_parser.add_argument("--workers", type=int, nargs="+", default=None, help="DataLoader worker counts")
+    run_parser.add_argument("--checkpoint", type=Path, default=None, help="Optional melcnn.pt for inference runs")
+    run_parser.add_argument("--baseline", type=Path, default=None, help="Compare against this results file")
+    run_parser.add_argument("--tolerance", type=float, default=0.10)
+
+    cmp_parser = sub.add_parser("compare", help="Flag regressions between two result files")
+    cmp_parser.add_argument("baseline", type=Path)
+    cmp_parser.add_argument("current", type=Path)
+    cmp_parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        current = run(args)
+        text = json.dumps(current, indent=2)
+        if args.out:
+            args.out.write_text(text)
+        else:
+            print(text)
+        if args.baseline is None:
+            return
+        baseline = json.loads(args.baseline.read_text())
+    else:
+        baseline = json.loads(args.baseline.read_text())
+        current = json.loads(args.current.read_text())
+    lines, regressions = compare(baseline, current, args.tolerance)
+    print("\n".join(lines), file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
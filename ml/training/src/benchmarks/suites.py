@@ -0,0 +1,190 @@
+"""
+Individual benchmarks. Each returns a list of result dicts:
+``{"name", "value", "unit", "higher_is_better"}``.
+"""
+
+from __future__ import annotations
+
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import torch
+from torch.utils.data import DataLoader
+
+import audio_io
+from dataset import HOP_LENGTH, TARGET_LEN, BatchMelFeatures, DeepfakeDataset, frames_for, pad_collate
+from model import MelCNN
+from multicrop import crop_starts, crop_windows
+from optimize_inference import fuse_melcnn
+
+
+def result(name: str, value: float, unit: str, higher_is_better: bool = False) -> Dict:
+    return {"name": name, "value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def timeit(fn: Callable[[], object], repeat: int, warmup: int = 2) -> float:
+    """Median wall time of ``fn`` in seconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def bench_decode(dataset: DeepfakeDataset, repeat: int) -> List[Dict]:
+    paths = [path for path, _ in dataset.items]
+
+    def decode_all():
+        for path in paths:
+            dataset.load(path)
+
+    def decode_crops():
+        for path in paths:
+            audio_io.load_crop(path, dataset.sample_rate, TARGET_LEN, lambda length: (length - TARGET_LEN) // 2)
+
+    return [
+        result("decode_resample", timeit(decode_all, repeat) / len(paths) * 1000, "ms/clip"),
+        result("decode_resample_crop", timeit(decode_crops, repeat) / len(paths) * 1000, "ms/clip"),
+    ]
+
+
+def bench_features(dataset: DeepfakeDataset, repeat: int, batch: int = 32) -> List[Dict]:
+    wav = torch.randn(1, TARGET_LEN) * 0.1
+
+    def per_sample():
+        mel = dataset.log_mel(wav)
+        return (mel - mel.mean()) / (mel.std() + 1e-5)
+
+    batched = BatchMelFeatures()
+    wavs = torch.randn(batch, 1, TARGET_LEN) * 0.1
+    return [
+        result("mel_db_normalize", timeit(per_sample, repeat * 10) * 1000, "ms/clip"),
+        result("mel_db_normalize_batched", timeit(lambda: batched(wavs), repeat) / batch * 1000, "ms/clip"),
+    ]
+
+
+def bench_getitem(root: Path, repeat: int) -> List[Dict]:
+    results = []
+    for mode, augment in (("eval", False), ("train", True)):
+        dataset = DeepfakeDataset(root, augment=augment)
+
+        def read_all():
+            for idx in range(len(dataset)):
+                dataset[idx]
+
+        seconds = timeit(read_all, repeat)
+        results.append(result(f"getitem_{mode}", seconds / len(dataset) * 1000, "ms/clip"))
+    return results
+
+
+def bench_multicrop(root: Path, repeat: int, crops: int = 4) -> List[Dict]:
+    """
+    Features for scoring every clip on ``crops`` windows: a decode/STFT per
+    window (``__getitem__`` per crop) vs one STFT per clip cut into windows.
+    """
+    windowed = DeepfakeDataset(root)
+    whole = DeepfakeDataset(root, max_len=1 << 30)
+    paths = [path for path, _ in windowed.items]
+    frames = frames_for(torch.from_numpy(windowed.durations() * windowed.sample_rate).long())
+    starts = (crop_starts(frames, crops) * HOP_LENGTH).tolist()
+
+    def window(path, start):
+        wav = audio_io.load_crop(path, windowed.sample_rate, TARGET_LEN, lambda length: start)
+        mel = windowed.log_mel(torch.nn.functional.pad(wav, (0, TARGET_LEN - wav.shape[1])))
+        return (mel - mel.mean()) / (mel.std() + 1e-5)
+
+    def separate():
+        return [torch.stack([window(path, start) for start in dict.fromkeys(clip_starts)])
+                for path, clip_starts in zip(paths, starts)]
+
+    def single_stft():
+        mels, _, lengths = pad_collate([whole[idx] for idx in range(len(whole))])
+        return crop_windows(mels, lengths, crops)
+
+    return [
+        result(f"multicrop{crops}_features_separate", timeit(separate, repeat, warmup=1) / len(paths) * 1000,
+               "ms/clip"),
+        result(f"multicrop{crops}_features_single_stft", timeit(single_stft, repeat, warmup=1) / len(paths) * 1000,
+               "ms/clip"),
+    ]
+
+
+def bench_dataloader(root: Path, repeat: int, worker_counts: List[int], batch: int = 16) -> List[Dict]:
+    dataset = DeepfakeDataset(root, augment=True)
+    results = []
+    for workers in worker_counts:
+        loader = DataLoader(dataset, batch_size=batch, shuffle=True, num_workers=workers,
+                            persistent_workers=workers > 0)
+
+        def epoch():
+            for _ in loader:
+                pass
+
+        seconds = timeit(epoch, repeat, warmup=1)
+        results.append(result(f"dataloader_workers{workers}", len(dataset) / seconds, "samples/s", True))
+    return results
+
+
+def bench_train_step(repeat: int, batch_sizes: List[int], frames: int) -> List[Dict]:
+    results = []
+    for batch in batch_sizes:
+        model = MelCNN().train()
+        optim = torch.optim.Adam(model.parameters(), lr=1e-4)
+        criterion = torch.nn.BCEWithLogitsLoss()
+        mel = torch.randn(batch, 1, 64, frames)
+        label = torch.randint(0, 2, (batch,)).float()
+
+        def step():
+            optim.zero_grad(set_to_none=True)
+            loss = criterion(model(mel), label)
+            loss.backward()
+            optim.step()
+
+        seconds = timeit(step, repeat)
+        results.append(result(f"train_step_b{batch}", batch / seconds, "samples/s", True))
+    return results
+
+
+def bench_inference(repeat: int, batch: int, frames: int, checkpoint: Path | None) -> List[Dict]:
+    model = MelCNN()
+    if checkpoint is not None:
+        model.load_state_dict(torch.load(checkpoint, map_location="cpu"))
+    model.eval()
+    runners = {"torch": model, "fused": fuse_melcnn(model)}
+    single = torch.randn(1, 1, 64, frames)
+    many = torch.randn(batch, 1, 64, frames)
+    results = []
+    with torch.no_grad():
+        for name, net in runners.items():
+            results.append(result(f"infer_{name}_b1", timeit(lambda: net(single), repeat * 5) * 1000, "ms"))
+            results.append(result(f"infer_{name}_b{batch}", batch / timeit(lambda: net(many), repeat),
+                                  "samples/s", True))
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return results
+    with tempfile.TemporaryDirectory() as tmp:
+        onnx_path = Path(tmp) / "melcnn.onnx"
+        torch.onnx.export(
+            runners["fused"], single, onnx_path, input_names=["mel"], output_names=["logits"],
+            dynamic_axes={"mel": {0: "batch", 3: "frames"}, "logits": {0: "batch"}}, opset_version=13,
+        )
+        session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+        single_np, many_np = single.numpy(), many.numpy()
+        results.append(result("infer_onnx_b1", timeit(lambda: session.run(None, {"mel": single_np}), repeat * 5)
+                              * 1000, "ms"))
+        results.append(result(f"infer_onnx_b{batch}", batch / timeit(lambda: session.run(None, {"mel": many_np}),
+                                                                      repeat), "samples/s", True))
+    return results
+
+
+def default_worker_counts() -> List[int]:
+    cpus = os.cpu_count() or 1
+    return sorted({0, 1, min(2, cpus), min(4, cpus)})
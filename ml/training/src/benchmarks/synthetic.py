@@ -0,0 +1,29 @@
+"""Deterministic synthetic WAV corpus so benchmarks need no real data."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+
+def make_corpus(root: Path, clips: int = 32, seed: int = 0) -> Path:
+    """
+    Write ``clips`` WAVs under ``root/{real,fake}`` with mixed sample rates,
+    channel counts and durations (1.5-8 s), mirroring the staged ASVspoof layout.
+    """
+    rng = np.random.default_rng(seed)
+    for i in range(clips):
+        label = "real" if i % 2 == 0 else "fake"
+        sample_rate = 16000 if i % 4 else 22050
+        seconds = rng.uniform(1.5, 8.0)
+        t = np.arange(int(sample_rate * seconds)) / sample_rate
+        tone = 0.3 * np.sin(2 * np.pi * rng.uniform(100, 1200) * t)
+        audio = tone + 0.02 * rng.standard_normal(t.size)
+        if i % 3 == 0:
+            audio = np.stack([audio, 0.5 * audio], axis=1)
+        out = root / label / f"{label}_{i:04d}.wav"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        sf.write(out, audio.astype(np.float32), sample_rate)
+    return root
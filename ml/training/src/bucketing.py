@@ -0,0 +1,72 @@
+"""
+Length-bucketed batching for variable-length clips.
+
+``LengthBucketBatchSampler`` wraps an index sampler (the class-balanced
+``WeightedRandomSampler``, its distributed variant, or a plain sequential one)
+and keeps its sampling distribution. It draws ``pool_batches`` batches' worth
+of indices, sorts that pool by clip length and cuts it into batches, so each
+batch holds clips of similar duration and ``pad_collate`` adds little
+padding. With ``shuffle`` the batch order within each pool is randomised,
+seeded by ``seed + epoch``, so resumed runs replay the same batches.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Iterable, Iterator, List
+
+import numpy as np
+from torch.utils.data import Sampler
+
+
+class LengthBucketBatchSampler(Sampler[List[int]]):
+    def __init__(self, sampler: Iterable[int], lengths: np.ndarray, batch_size: int, pool_batches: int | None = 50,
+                 shuffle: bool = True, drop_last: bool = False, seed: int = 0):
+        """``pool_batches=None`` sorts the whole epoch at once (evaluation)."""
+        self.sampler = sampler
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.pool_batches = pool_batches
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
+
+    def _pool_batches(self, pool: List[int], rng: np.random.Generator) -> Iterator[List[int]]:
+        indices = np.asarray(pool)
+        indices = indices[np.argsort(self.lengths[indices], kind="stable")]
+        batches = [indices[i:i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+        if self.drop_last and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        order = rng.permutation(len(batches)) if self.shuffle else range(len(batches))
+        for i in order:
+            yield batches[i].tolist()
+
+    def __iter__(self) -> Iterator[List[int]]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        pool_size = self.batch_size * self.pool_batches if self.pool_batches else None
+        pool: List[int] = []
+        for idx in self.sampler:
+            pool.append(idx)
+            if pool_size and len(pool) == pool_size:
+                yield from self._pool_batches(pool, rng)
+                pool = []
+        if pool:
+            yield from self._pool_batches(pool, rng)
+
+    def __len__(self) -> int:
+        count = len(self.sampler)
+        pool_size = self.batch_size * self.pool_batches if self.pool_batches else count
+        full, rest = divmod(count, max(pool_size, 1))
+        per_pool = (lambda n: n // self.batch_size) if self.drop_last else (lambda n: math.ceil(n / self.batch_size))
+        return full * per_pool(pool_size) + per_pool(rest)
+
+    def order(self) -> np.ndarray:
+        """Dataset indices in iteration order (for evaluation, where the order is deterministic)."""
+        batches = list(self)
+        return np.concatenate(batches) if batches else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,123 @@
+"""
+Full training-state checkpoints, written off the training thread.
+
+``AsyncCheckpointer.save`` copies the state to CPU on the caller's thread (a
+snapshot that later optimizer steps cannot change), then a background thread
+serialises it to a temporary file, fsyncs and renames it into place, so a
+crash mid-write never leaves a truncated checkpoint. Only the newest ``keep``
+rotating checkpoints are retained.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r"^checkpoint-epoch(\d+)\.pt$")
+
+
+def snapshot(obj: Any) -> Any:
+    """Deep copy of a (nested) state with every tensor cloned to CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+def capture_rng_state() -> Dict[str, Any]:
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: Dict[str, Any]) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def atomic_save(obj: Any, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with tmp.open("wb") as handle:
+        torch.save(obj, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, path)
+
+
+def list_checkpoints(directory: Path) -> List[Path]:
+    """Rotating checkpoints in ``directory``, oldest first."""
+    if not directory.is_dir():
+        return []
+    found = [(int(m.group(1)), p) for p in directory.iterdir() if (m := CHECKPOINT_PATTERN.match(p.name))]
+    return [path for _, path in sorted(found)]
+
+
+def latest_checkpoint(path: Path) -> Path | None:
+    """``path`` itself if it is a file, else the newest rotating checkpoint inside it."""
+    if path.is_file():
+        return path
+    checkpoints = list_checkpoints(path)
+    return checkpoints[-1] if checkpoints else None
+
+
+class AsyncCheckpointer:
+    """Background writer; a failed write is re-raised on the next ``save``/``wait``."""
+
+    def __init__(self, directory: Path, keep: int = 3):
+        self.directory = Path(directory)
+        self.keep = keep
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending: List[Future] = []
+
+    def save(self, state: Dict[str, Any], path: Path) -> None:
+        """Write ``state`` to ``path`` in the background."""
+        self._check()
+        self._pending.append(self._pool.submit(atomic_save, snapshot(state), Path(path)))
+
+    def save_epoch(self, state: Dict[str, Any], epoch: int) -> Path:
+        """Write a rotating checkpoint for ``epoch`` and drop all but the newest ``keep``."""
+        path = self.directory / f"checkpoint-epoch{epoch:04d}.pt"
+        self._check()
+        self._pending.append(self._pool.submit(self._write_and_rotate, snapshot(state), path))
+        return path
+
+    def _write_and_rotate(self, state: Dict[str, Any], path: Path) -> None:
+        atomic_save(state, path)
+        for old in list_checkpoints(self.directory)[:-self.keep] if self.keep > 0 else []:
+            old.unlink(missing_ok=True)
+
+    def _check(self) -> None:
+        done = [future for future in self._pending if future.done()]
+        self._pending = [future for future in self._pending if not future.done()]
+        for future in done:
+            future.result()
+
+    def wait(self) -> None:
+        for future in self._pending:
+            future.result()
+        self._pending = []
+
+    def close(self) -> None:
+        try:
+            self.wait()
+        finally:
+            self._pool.shutdown(wait=True)
@@ -1,54 +1,204 @@
 from pathlib import Path
 
-import soundfile as sf
+import numpy as np
 import torch
+import torch.nn as nn
 import torchaudio
 import torch.nn.functional as F
-from torchaudio.functional import resample
 from torch.utils.data import Dataset
 
+import audio_io
+from feature_store import FeatureStore
+from manifest import Manifest, ManifestItems
+from preprocess.vad import FRAME_HOP, FRAME_LENGTH, THRESHOLD_DB, trim_silence
+
 SAMPLE_RATE = 16000
 CLIP_SECONDS = 3
 TARGET_LEN = SAMPLE_RATE * CLIP_SECONDS
+N_FFT = 1024
+HOP_LENGTH = 256
+N_MELS = 64
+TARGET_FRAMES = TARGET_LEN // HOP_LENGTH + 1
+# Variable-length mode pads only clips shorter than one FFT window
+MIN_LEN = N_FFT
+
+
+def frames_for(samples):
+    """Log-mel frames for ``samples`` samples (centred STFT); works on ints and tensors."""
+    return samples // HOP_LENGTH + 1
+
+
+def masked_normalize(mel_db, frames):
+    """
+    Per-utterance normalisation of zero-padded (batch, 1, n_mels, time)
+    log-mels over each clip's first ``frames`` frames; padding stays zero.
+    """
+    mask = (torch.arange(mel_db.shape[-1], device=mel_db.device) < frames.to(mel_db.device)[:, None])
+    mask = mask[:, None, None, :].to(mel_db.dtype)
+    count = mask.sum(dim=(1, 2, 3), keepdim=True) * mel_db.shape[2]
+    mean = (mel_db * mask).sum(dim=(1, 2, 3), keepdim=True) / count
+    var = (((mel_db - mean) * mask) ** 2).sum(dim=(1, 2, 3), keepdim=True) / (count - 1).clamp(min=1)
+    return (mel_db - mean) / (var.sqrt() + 1e-5) * mask
+
+
+def pad_collate(batch):
+    """
+    Zero-pad a batch of variable-length (1, ..., time) items to its longest
+    one; returns (inputs, labels, lengths) with lengths in the items' own time
+    unit (samples for raw waveforms, frames for log-mels).
+    """
+    inputs, labels = zip(*batch)
+    lengths = torch.tensor([x.shape[-1] for x in inputs])
+    padded = inputs[0].new_zeros((len(inputs), *inputs[0].shape[:-1], int(lengths.max())))
+    for i, x in enumerate(inputs):
+        padded[i, ..., :x.shape[-1]] = x
+    return padded, torch.tensor(labels), lengths
 
 
 class DeepfakeDataset(Dataset):
-    def __init__(self, root: Path, sample_rate: int = SAMPLE_RATE, *, items=None, augment: bool = False):
-        self.items = items if items is not None else []
-        if not self.items:
+    def __init__(
+        self,
+        root: Path,
+        sample_rate: int = SAMPLE_RATE,
+        *,
+        items=None,
+        augment: bool = False,
+        feature_store: Path | None = None,
+        raw_waveform: bool = False,
+        vad: bool = False,
+        max_len: int | None = None,
+    ):
+        """
+        ``max_len`` switches to variable-length items: clips keep their real
+        length (cropped to at most ``max_len`` samples) instead of being padded
+        or cropped to TARGET_LEN; batch them with ``pad_collate``.
+        """
+        if items is not None:
+            self.items = items
+            self.labels = np.fromiter((label for _, label in items), dtype=np.int8, count=len(items))
+        elif Manifest.exists(root):
+            # Staged splits carry a memory-mapped manifest; no globbing or per-row objects
+            manifest = Manifest(root)
+            self.items = ManifestItems(manifest)
+            self.labels = manifest.labels
+        else:
+            self.items = []
             for label_name, target in (("real", 0), ("fake", 1)):
                 for wav in (root / label_name).glob("*.wav"):
                     self.items.append((wav, target))
+            self.labels = np.fromiter((label for _, label in self.items), dtype=np.int8, count=len(self.items))
         self.sample_rate = sample_rate
         self.augment = augment
+        self.raw_waveform = raw_waveform
+        self.vad = vad
+        self.max_len = max_len
         self.melspec = torchaudio.transforms.MelSpectrogram(
-            sample_rate=sample_rate, n_fft=1024, hop_length=256, n_mels=64
+            sample_rate=sample_rate, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS
         )
         self.to_db = torchaudio.transforms.AmplitudeToDB()
+        self.store = None
+        if feature_store is not None:
+            self.store = FeatureStore.build(
+                feature_store, self.items, self.store_features, self.feature_params()
+            )
+
+    def feature_params(self):
+        params = {
+            "pipeline": "dataset",
+            "sample_rate": self.sample_rate,
+            "n_fft": N_FFT,
+            "hop_length": HOP_LENGTH,
+            "n_mels": N_MELS,
+            "min_len": self.min_len,
+        }
+        if self.vad:
+            # Only recorded when enabled so existing stores stay valid
+            params["vad"] = {"frame_length": FRAME_LENGTH, "hop": FRAME_HOP, "threshold_db": THRESHOLD_DB}
+        return params
+
+    @property
+    def min_len(self):
+        return MIN_LEN if self.max_len is not None else TARGET_LEN
+
+    @property
+    def crop_len(self):
+        return self.max_len if self.max_len is not None else TARGET_LEN
 
     def __len__(self):
         return len(self.items)
 
+    def durations(self) -> np.ndarray:
+        """Clip durations in seconds, from the manifest or (for plain directories) the file headers."""
+        if isinstance(self.items, ManifestItems):
+            return np.asarray(self.items.manifest.durations, dtype=np.float64)
+        durations = np.empty(len(self.items))
+        for i, (path, _) in enumerate(self.items):
+            frames, sample_rate = audio_io.info(str(path))
+            durations[i] = frames / sample_rate
+        return durations
+
+    def load(self, path):
+        """Decode ``path`` (a filename or file-like object) to a mono (1, n) tensor at ``sample_rate``."""
+        return audio_io.load(path, self.sample_rate)
+
+    def log_mel(self, wav):
+        return self.to_db(self.melspec(wav))
+
+    def store_features(self, path):
+        """Un-normalised log-mel of the whole clip (padded to ``min_len``), as cached in the feature store."""
+        wav = self.load(path)
+        if self.vad:
+            wav = trim_silence(wav)
+        if wav.shape[1] < self.min_len:
+            wav = F.pad(wav, (0, self.min_len - wav.shape[1]))
+        return self.log_mel(wav)[0]
+
+    def _crop_start(self, length, target):
+        if length <= target:
+            return 0
+        if self.augment:
+            return torch.randint(0, length - target + 1, (1,)).item()
+        return max((length - target) // 2, 0)
+
+    def _item_from_store(self, idx):
+        # Crops happen in frame space on the memory-mapped view; only the
+        # normalisation below allocates. Waveform gain/noise augmentation has no
+        # equivalent here (gain is cancelled by normalisation anyway).
+        mel_db = self.store[idx]
+        frames = frames_for(self.crop_len)
+        start = self._crop_start(mel_db.shape[-1], frames)
+        mel_db = mel_db[..., start:start + frames]
+        mel_db = (mel_db - mel_db.mean()) / (mel_db.std() + 1e-5)
+        return mel_db, self.items[idx][1]
+
     def __getitem__(self, idx):
-        path, label = self.items[idx]
-        wav_np, sr = sf.read(path, always_2d=True)      # (frames, channels)
-        wav = torch.from_numpy(wav_np.T).float()        # (channels, frames)
-        if wav.shape[0] > 1:
-            wav = wav.mean(dim=0, keepdim=True)         # mono
+        if self.store is not None:
+            return self._item_from_store(idx)
 
-        if sr != self.sample_rate:
-            wav = resample(wav, orig_freq=sr, new_freq=self.sample_rate)
+        path, label = self.items[idx]
+        return self.process(path, label)
 
-        # Length handling: random crop for training, center crop for eval
-        if wav.shape[1] < TARGET_LEN:
-            pad = TARGET_LEN - wav.shape[1]
-            wav = F.pad(wav, (0, pad))
+    def process(self, source, label):
+        # Length handling: random crop for training, center crop for eval.
+        # Without VAD only the cropped window is decoded; VAD needs the whole
+        # clip to find its bounds (same trimming as preprocess_audio.py).
+        crop_len = self.crop_len
+        if self.vad:
+            wav = trim_silence(self.load(source))
+            if wav.shape[1] > crop_len:
+                start = self._crop_start(wav.shape[1], crop_len)
+                wav = wav[:, start:start + crop_len]
         else:
-            if self.augment:
-                start = torch.randint(0, wav.shape[1] - TARGET_LEN + 1, (1,)).item()
-            else:
-                start = max((wav.shape[1] - TARGET_LEN) // 2, 0)
-            wav = wav[:, start:start + TARGET_LEN]
+            wav = audio_io.load_crop(
+                source, self.sample_rate, crop_len, lambda length: self._crop_start(length, crop_len)
+            )
+        if wav.shape[1] < self.min_len:
+            pad = self.min_len - wav.shape[1]
+            wav = F.pad(wav, (0, pad))
+
+        if self.raw_waveform:
+            # Augmentation and features are applied per batch by BatchMelFeatures
+            return wav, label
 
         if self.augment:
             gain = torch.empty(1).uniform_(0.8, 1.2).item()
@@ -56,7 +206,37 @@ class DeepfakeDataset(Dataset):
             noise = torch.randn_like(wav) * 0.003
             wav = wav + noise
 
-        mel = self.melspec(wav)
-        mel_db = self.to_db(mel)
+        mel_db = self.log_mel(wav)
         mel_db = (mel_db - mel_db.mean()) / (mel_db.std() + 1e-5)
         return mel_db, label
+
+
+class BatchMelFeatures(nn.Module):
+    """
+    Batched equivalent of the per-sample path in ``DeepfakeDataset.__getitem__``.
+
+    Takes (batch, 1, TARGET_LEN) waveforms from a ``raw_waveform`` dataset and
+    applies gain/noise augmentation, log-mel and per-utterance normalisation in
+    one vectorised call, typically on the training device. For zero-padded
+    variable-length batches pass ``lengths`` (samples per clip): normalisation
+    then covers only each clip's own frames.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        super().__init__()
+        self.melspec = torchaudio.transforms.MelSpectrogram(
+            sample_rate=sample_rate, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=N_MELS
+        )
+        self.to_db = torchaudio.transforms.AmplitudeToDB()
+
+    def forward(self, wav, augment: bool = False, lengths=None):
+        if augment:
+            gain = torch.empty(wav.shape[0], 1, 1, device=wav.device).uniform_(0.8, 1.2)
+            wav = wav * gain + torch.randn_like(wav) * 0.003
+        mel_db = self.to_db(self.melspec(wav))
+        if lengths is not None:
+            return masked_normalize(mel_db, frames_for(lengths))
+        dims = tuple(range(1, mel_db.dim()))
+        mean = mel_db.mean(dim=dims, keepdim=True)
+        std = mel_db.std(dim=dims, keepdim=True)
+        return (mel_db - mean) / (std + 1e-5)
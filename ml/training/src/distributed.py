@@ -0,0 +1,134 @@
+"""
+DistributedDataParallel helpers for ``train.py``.
+
+Launch with torchrun; ``init_distributed`` reads the RANK / WORLD_SIZE /
+LOCAL_RANK variables it sets and falls back to a single process otherwise.
+gloo works for CPU processes on one or several machines, nccl for GPUs:
+
+    torchrun --standalone --nproc-per-node 4 train.py --dist-backend gloo ...
+    torchrun --nnodes 2 --node-rank 0 --rdzv-endpoint host:29500 --nproc-per-node 8 train.py ...
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+
+@dataclass
+class DistContext:
+    rank: int = 0
+    world_size: int = 1
+    local_rank: int = 0
+    device: torch.device = torch.device("cpu")
+
+    @property
+    def enabled(self) -> bool:
+        return self.world_size > 1
+
+    @property
+    def is_main(self) -> bool:
+        return self.rank == 0
+
+
+def init_distributed(backend: str | None = None) -> DistContext:
+    """Join the process group when launched by torchrun; pick this rank's device."""
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    use_cuda = torch.cuda.is_available() and backend != "gloo"
+    if world_size <= 1:
+        return DistContext(device=torch.device("cuda" if use_cuda else "cpu"))
+    rank = int(os.environ["RANK"])
+    local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+    if use_cuda:
+        torch.cuda.set_device(local_rank)
+        device = torch.device("cuda", local_rank)
+    else:
+        device = torch.device("cpu")
+    dist.init_process_group(backend=backend or ("nccl" if use_cuda else "gloo"))
+    return DistContext(rank, world_size, local_rank, device)
+
+
+def cleanup(ctx: DistContext) -> None:
+    if ctx.enabled and dist.is_initialized():
+        dist.destroy_process_group()
+
+
+@contextmanager
+def main_process_first(ctx: DistContext):
+    """Let rank 0 run the block (e.g. building a feature store) before the other ranks reuse its result."""
+    if ctx.enabled and not ctx.is_main:
+        dist.barrier()
+    yield
+    if ctx.enabled and ctx.is_main:
+        dist.barrier()
+
+
+def gather_objects(ctx: DistContext, obj) -> list:
+    """``obj`` from every rank, in rank order (``[obj]`` in a single process)."""
+    if not ctx.enabled:
+        return [obj]
+    gathered = [None] * ctx.world_size
+    dist.all_gather_object(gathered, obj)
+    return gathered
+
+
+def all_reduce_sum(ctx: DistContext, *values: float) -> list:
+    """Sum scalars over all ranks (returns them unchanged in a single process)."""
+    if not ctx.enabled:
+        return list(values)
+    tensor = torch.tensor(values, dtype=torch.float64, device=ctx.device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
+
+
+class DistributedWeightedSampler(Sampler[int]):
+    """
+    ``WeightedRandomSampler`` (with replacement) sharded across ranks.
+
+    Every rank draws the same global sequence from a generator seeded with
+    ``seed + epoch`` and keeps every ``world_size``-th index, so the ranks
+    together see one class-balanced epoch without communicating. Call
+    ``set_epoch`` before each epoch.
+    """
+
+    def __init__(self, weights: torch.Tensor, num_samples: int, rank: int, world_size: int, seed: int = 0):
+        self.weights = torch.as_tensor(weights, dtype=torch.double)
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.epoch = 0
+        self.num_samples = math.ceil(num_samples / world_size)
+        self.total_size = self.num_samples * world_size
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        indices = torch.multinomial(self.weights, self.total_size, replacement=True, generator=generator)
+        return iter(indices[self.rank::self.world_size].tolist())
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+
+class ShardSampler(Sampler[int]):
+    """Contiguous, non-overlapping slice of ``range(n)`` for this rank; no padding, so evaluation counts are exact."""
+
+    def __init__(self, count: int, rank: int, world_size: int):
+        per_rank = math.ceil(count / world_size)
+        self.indices = range(rank * per_rank, min((rank + 1) * per_rank, count))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.indices)
+
+    def __len__(self) -> int:
+        return len(self.indices)
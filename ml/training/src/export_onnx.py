@@ -1,16 +1,20 @@
 import argparse, torch
-from model import MelCNN
+from models import load_checkpoint
+from optimize_inference import check_equivalence, fuse_melcnn
 from pathlib import Path
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--checkpoint", type=Path, default=Path("../../ml/model/melcnn.pt"))
     parser.add_argument("--out", type=Path, default=Path("../../ml/model/model.onnx"))
+    parser.add_argument("--no-fuse", action="store_true", help="Export without folding BatchNorm into the convs")
     args = parser.parse_args()
 
-    model = MelCNN()
-    model.load_state_dict(torch.load(args.checkpoint, map_location="cpu"))
-    model.eval()
+    model = load_checkpoint(args.checkpoint)
+    if not args.no_fuse:
+        fused = fuse_melcnn(model)
+        print(f"Fused Conv-BN-ReLU (max logit diff {check_equivalence(model, fused):.2e})")
+        model = fused
 
     dummy = torch.randn(1, 1, 64, 300)  # adjust time dimension to your mel length
     torch.onnx.export(
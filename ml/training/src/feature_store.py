@@ -0,0 +1,199 @@
+"""
+Memory-mapped cache of precomputed log-mel features.
+
+All clips live in a single float32 file of shape (total_frames, n_mels); a JSON
+manifest records where each clip starts, how many frames it has and the key it
+was computed from. Keys hash the source path, its mtime/size and the feature
+parameters, so editing a clip or changing the mel settings rebuilds only the
+affected entries.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import torch
+from tqdm import tqdm
+
+DATA_FILE = "features.f32"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def entry_key(path: Path, params: Dict) -> str:
+    stat = Path(path).stat()
+    blob = json.dumps(
+        {"path": str(Path(path).resolve()), "mtime": stat.st_mtime_ns, "size": stat.st_size, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def _read_manifest(root: Path) -> Dict | None:
+    manifest_path = root / MANIFEST_FILE
+    if not manifest_path.exists() or not (root / DATA_FILE).exists():
+        return None
+    with manifest_path.open("r", encoding="utf-8") as handle:
+        manifest = json.load(handle)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def _init_worker() -> None:
+    # One process per core already; stop each worker from spawning its own thread pool.
+    torch.set_num_threads(1)
+
+
+def _computed_blocks(
+    paths: List[Path],
+    compute: Callable[[Path], torch.Tensor],
+    compute_batch: Callable[[Sequence[Path]], List[torch.Tensor]] | None,
+    workers: int,
+    batch_size: int,
+) -> Iterator[torch.Tensor]:
+    """Features for ``paths`` in order, computed in batches across worker processes when asked to."""
+    if compute_batch is None:
+        if workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                yield from pool.map(compute, paths, chunksize=batch_size)
+        else:
+            yield from map(compute, paths)
+        return
+    chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for blocks in pool.map(compute_batch, chunks):
+                yield from blocks
+    else:
+        for chunk in chunks:
+            yield from compute_batch(chunk)
+
+
+class FeatureStore:
+    """Read-only view over a built store; indices follow the build order."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        manifest = _read_manifest(self.root)
+        if manifest is None:
+            raise FileNotFoundError(f"No feature store at {self.root}")
+        self.params = manifest["params"]
+        self.n_mels = manifest["n_mels"]
+        self.total_frames = manifest["total_frames"]
+        self.entries = manifest["entries"]
+        self.offsets = np.array([e["offset"] for e in self.entries], dtype=np.int64)
+        self.frames = np.array([e["frames"] for e in self.entries], dtype=np.int64)
+        self._data = None
+
+    @classmethod
+    def build(
+        cls,
+        root: Path,
+        items: Sequence[Tuple[Path, int]],
+        compute: Callable[[Path], torch.Tensor],
+        params: Dict,
+        *,
+        desc: str = "Caching features",
+        compute_batch: Callable[[Sequence[Path]], List[torch.Tensor]] | None = None,
+        workers: int = 0,
+        batch_size: int = 32,
+    ) -> "FeatureStore":
+        """
+        Create or refresh the store at ``root`` for ``items``.
+
+        ``compute`` maps a path to an (n_mels, frames) tensor. Entries whose key
+        still matches are copied from the previous store; everything else is
+        recomputed. Returns the store unchanged when nothing is stale.
+
+        ``compute_batch`` (a list of paths to a list of tensors) is used instead
+        of ``compute`` when given, ``batch_size`` paths at a time; with
+        ``workers > 1`` batches are computed in a process pool (both callables
+        must then be picklable, i.e. module-level functions).
+        """
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        keys = [entry_key(path, params) for path, _ in items]
+
+        previous = _read_manifest(root)
+        reusable: Dict[str, Dict] = {}
+        old_data = None
+        if previous is not None and previous["params"] == params and previous["total_frames"] > 0:
+            if [e["key"] for e in previous["entries"]] == keys:
+                return cls(root)
+            reusable = {e["key"]: e for e in previous["entries"]}
+            old_data = np.memmap(
+                root / DATA_FILE, dtype=np.float32, mode="r", shape=(previous["total_frames"], previous["n_mels"])
+            )
+
+        entries: List[Dict] = []
+        offset = 0
+        n_mels = None
+        rebuilt = 0
+        tmp_path = root / (DATA_FILE + ".tmp")
+        stale = [path for (path, _), key in zip(items, keys) if key not in reusable]
+        computed = _computed_blocks(stale, compute, compute_batch, workers, batch_size)
+        with tmp_path.open("wb") as out:
+            for (path, label), key in tqdm(list(zip(items, keys)), desc=desc, leave=False):
+                cached = reusable.get(key)
+                if cached is not None:
+                    block = old_data[cached["offset"]: cached["offset"] + cached["frames"]]
+                else:
+                    block = next(computed).detach().cpu().numpy().T
+                    rebuilt += 1
+                block = np.ascontiguousarray(block, dtype=np.float32)
+                if n_mels is None:
+                    n_mels = block.shape[1]
+                elif block.shape[1] != n_mels:
+                    raise ValueError(f"{path}: expected {n_mels} mel bins, got {block.shape[1]}")
+                out.write(block.tobytes())
+                entries.append(
+                    {"key": key, "path": str(path), "label": int(label), "offset": offset, "frames": block.shape[0]}
+                )
+                offset += block.shape[0]
+
+        del old_data
+        os.replace(tmp_path, root / DATA_FILE)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "params": params,
+            "n_mels": n_mels or 0,
+            "total_frames": offset,
+            "entries": entries,
+        }
+        tmp_manifest = root / (MANIFEST_FILE + ".tmp")
+        with tmp_manifest.open("w", encoding="utf-8") as handle:
+            json.dump(manifest, handle)
+        os.replace(tmp_manifest, root / MANIFEST_FILE)
+        print(f"Feature store {root}: {len(entries)} clips ({rebuilt} rebuilt)")
+        return cls(root)
+
+    @property
+    def data(self) -> np.memmap:
+        # Opened lazily so DataLoader workers map the file themselves instead of
+        # receiving a pickled copy of the whole array.
+        if self._data is None:
+            self._data = np.memmap(
+                self.root / DATA_FILE, dtype=np.float32, mode="c", shape=(self.total_frames, self.n_mels)
+            )
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, idx) -> torch.Tensor:
+        """Return a zero-copy (1, n_mels, frames) view of clip ``idx``."""
+        start = self.offsets[idx]
+        block = self.data[start: start + self.frames[idx]]
+        return torch.from_numpy(block).T.unsqueeze(0)
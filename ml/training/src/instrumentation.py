@@ -0,0 +1,143 @@
+"""
+Opt-in training-loop instrumentation.
+
+``StepTimer`` splits each step into laps (data wait, host-to-device copy,
+forward, backward, optimizer). With ``sync=True`` it synchronises the device
+at every lap so asynchronous CUDA kernels are charged to the phase that
+launched them; without it only the data/compute split is trustworthy on
+accelerators. ``MetricsLog`` appends JSON lines, and ``make_profiler`` wraps a
+few steps in ``torch.profiler`` and writes a Chrome trace.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict
+
+import torch
+
+PHASES = ("data", "h2d", "forward", "backward", "optimizer")
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process (None where ``resource`` is unavailable, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def accelerator_memory_mb(device: torch.device) -> Dict[str, float]:
+    if device.type != "cuda":
+        return {}
+    return {
+        "cuda_peak_allocated_mb": torch.cuda.max_memory_allocated(device) / 2**20,
+        "cuda_peak_reserved_mb": torch.cuda.max_memory_reserved(device) / 2**20,
+    }
+
+
+class StepTimer:
+    """Per-phase wall-clock timer; call ``lap(phase)`` at the end of each phase and ``end_step`` after the last."""
+
+    def __init__(self, device: torch.device, sync: bool = False):
+        self.device = device
+        self.sync = sync and device.type == "cuda"
+        self.reset()
+
+    def reset(self) -> None:
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.steps = 0
+        self.samples = 0
+        self._step: Dict[str, float] = {}
+        self._last = time.perf_counter()
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+    def lap(self, phase: str) -> None:
+        if self.sync:
+            torch.cuda.synchronize(self.device)
+        now = time.perf_counter()
+        self._step[phase] = self._step.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def end_step(self, samples: int) -> Dict[str, float]:
+        """Close the step and return its phase times in milliseconds."""
+        step, self._step = self._step, {}
+        for phase, seconds in step.items():
+            self.totals[phase] += seconds
+        self.steps += 1
+        self.samples += samples
+        return {f"{phase}_ms": seconds * 1000 for phase, seconds in step.items()}
+
+    @property
+    def data_seconds(self) -> float:
+        return self.totals.get("data", 0.0)
+
+    @property
+    def compute_seconds(self) -> float:
+        return sum(seconds for phase, seconds in self.totals.items() if phase != "data")
+
+    def summary(self) -> Dict[str, float]:
+        """Epoch totals, per-step means and memory peaks."""
+        wall = sum(self.totals.values())
+        out: Dict[str, float] = {"steps": self.steps, "samples": self.samples, "seconds": wall,
+                                 "samples_per_s": self.samples / max(wall, 1e-9)}
+        for phase, seconds in self.totals.items():
+            out[f"{phase}_s"] = seconds
+            out[f"{phase}_ms_per_step"] = seconds * 1000 / max(self.steps, 1)
+            out[f"{phase}_share"] = seconds / max(wall, 1e-9)
+        rss = peak_rss_mb()
+        if rss is not None:
+            out["peak_rss_mb"] = rss
+        out.update(accelerator_memory_mb(self.device))
+        return out
+
+
+class MetricsLog:
+    """Append-only JSONL metrics file; every record gets a ``type`` and wall-clock ``time``."""
+
+    def __init__(self, path: Path | None):
+        self._handle = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = path.open("a", encoding="utf-8")
+
+    def write(self, kind: str, **fields) -> None:
+        if self._handle is None:
+            return
+        self._handle.write(json.dumps({"type": kind, "time": time.time(), **fields}) + "\n")
+
+    def flush(self) -> None:
+        if self._handle is not None:
+            self._handle.flush()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+def make_profiler(steps: int, trace_path: Path, device: torch.device) -> torch.profiler.profile:
+    """Profile ``steps`` steps after one skipped and one warm-up step; the Chrome trace is written when they end."""
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if device.type == "cuda":
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    trace_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(prof):
+        prof.export_chrome_trace(str(trace_path))
+        print(f"Profiler trace written to {trace_path} (open in chrome://tracing or ui.perfetto.dev)")
+        print(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(wait=1, warmup=1, active=steps, repeat=1),
+        on_trace_ready=export,
+        record_shapes=True,
+        profile_memory=True,
+    )
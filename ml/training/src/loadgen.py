@@ -0,0 +1,145 @@
+"""
+Closed-loop load generator for ``serve.py``.
+
+``--concurrency`` client threads each POST audio files back to back over a
+keep-alive connection, for ``--requests`` requests in total or for
+``--duration`` seconds. The client-side latency percentiles and throughput
+are printed next to the server's own ``/metrics`` (queue wait, inference
+time, batch sizes), which are reset at the start of the run. Without
+``--audio``, a synthetic corpus is generated.
+
+    python serve.py --model ../../ml/model/melcnn.pt --port 8080 &
+    python loadgen.py --url http://127.0.0.1:8080 --concurrency 32 --requests 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import itertools
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from benchmarks.synthetic import make_corpus
+from score import resolve_inputs
+from serve import percentiles
+
+
+class Client:
+    def __init__(self, url: str, timeout: float = 60.0):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _send(self, method: str, path: str, body: bytes | None) -> Dict:
+        self.conn.request(method, path, body=body, headers={"Content-Type": "application/octet-stream"})
+        response = self.conn.getresponse()
+        payload = json.loads(response.read() or b"{}")
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}: {payload.get('error')}")
+        return payload
+
+    def request(self, method: str, path: str, body: bytes | None = None) -> Dict:
+        try:
+            return self._send(method, path, body)
+        except (ConnectionError, http.client.HTTPException):
+            # The server may have closed an idle keep-alive connection; reconnect once
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            return self._send(method, path, body)
+
+
+def run_load(url: str, clips: List[bytes], concurrency: int, requests: int | None, duration: float | None) -> Dict:
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker():
+        client = Client(url)
+        while True:
+            n = next(counter)
+            if (requests is not None and n >= requests) or (deadline is not None and time.perf_counter() >= deadline):
+                return
+            started = time.perf_counter()
+            try:
+                client.request("POST", "/score", clips[n % len(clips)])
+            except Exception as exc:
+                with lock:
+                    errors.append(f"{type(exc).__name__}: {exc}")
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_errors": errors[:5],
+        "elapsed_s": elapsed,
+        "requests_per_s": len(latencies) / max(elapsed, 1e-9),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def format_ms(stats: Dict | None) -> str:
+    if not stats:
+        return "-"
+    return f"p50 {stats['p50']:.1f}  p90 {stats['p90']:.1f}  p99 {stats['p99']:.1f}  max {stats['max']:.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--audio", nargs="*", default=[], help="Directories, globs or manifests (as for score.py)")
+    parser.add_argument("--clips", type=int, default=32, help="Synthetic clips when --audio is not given")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client connections")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=8, help="Unmeasured requests sent first")
+    parser.add_argument("--json", type=Path, default=None, help="Also write client and server stats as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = resolve_inputs(args.audio) if args.audio else resolve_inputs([str(make_corpus(Path(tmp), args.clips))])
+        clips = [path.read_bytes() for path in paths]
+    if not clips:
+        raise SystemExit("No audio files found")
+
+    client = Client(args.url)
+    for clip in clips[:args.warmup]:
+        client.request("POST", "/score", clip)
+    client.request("POST", "/metrics/reset")
+    print(f"{len(clips)} clips, {args.concurrency} concurrent clients, "
+          + (f"{args.duration:g} s" if args.duration else f"{args.requests} requests"))
+    result = run_load(args.url, clips, args.concurrency, None if args.duration else args.requests, args.duration)
+    server = client.request("GET", "/metrics")
+
+    print(f"client: {result['requests']} ok, {result['errors']} errors, {result['requests_per_s']:.1f} req/s")
+    print(f"  latency {format_ms(result['latency_ms'])}")
+    for error in result["first_errors"]:
+        print(f"  error: {error}")
+    print(f"server: {server['requests_per_s']:.1f} req/s, mean batch {server['mean_batch_size']:.1f} "
+          f"over {server['batches']} batches")
+    for name in ("latency_ms", "feature_ms", "queue_ms", "inference_ms"):
+        print(f"  {name[:-3]:9s} {format_ms(server[name])}")
+    print(f"  batch sizes {server['batch_size_histogram']}")
+    if args.json:
+        args.json.write_text(json.dumps({"client": result, "server": server}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
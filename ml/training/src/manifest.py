@@ -0,0 +1,175 @@
+"""
+Columnar, memory-mapped dataset manifest.
+
+A staged split (``data/raw/train``) gets a ``manifest/`` directory holding one
+``.npy`` file per column plus the UTF-8 paths packed into a single blob:
+
+    label.npy        int8     0 = real, 1 = fake
+    duration.npy     float32  seconds
+    sample_rate.npy  int32
+    path_offset.npy  int64    n + 1 byte offsets into paths.bin
+    paths.bin                 paths relative to the split directory
+    meta.json                 version and row count (written last)
+
+Columns are opened with ``mmap_mode="r"``, so building a dataset, counting
+classes, weighting a sampler or splitting train/val are array operations
+that never touch per-row Python objects. ``split_asvspoof.py`` writes the
+manifest while staging; ``python manifest.py data/raw/train`` indexes an
+existing real/fake tree.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+
+MANIFEST_DIR = "manifest"
+MANIFEST_VERSION = 1
+LABEL_DIRS = (("real", 0), ("fake", 1))
+
+
+def _save_column(directory: Path, name: str, values: np.ndarray) -> None:
+    tmp = directory / f".{name}.tmp.npy"
+    np.save(tmp, values)
+    os.replace(tmp, directory / f"{name}.npy")
+
+
+class Manifest:
+    """Read-only view of a split's manifest; row ``i`` is utterance ``i`` (its path id)."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.directory = self.root / MANIFEST_DIR
+        with (self.directory / "meta.json").open("r", encoding="utf-8") as handle:
+            meta = json.load(handle)
+        if meta.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {meta.get('version')} in {self.directory}")
+        self.count = meta["count"]
+        self.labels = self._column("label")
+        self.durations = self._column("duration")
+        self.sample_rates = self._column("sample_rate")
+        self.path_offsets = self._column("path_offset")
+        self._paths = np.memmap(self.directory / "paths.bin", dtype=np.uint8, mode="r") if self.count else None
+
+    def _column(self, name: str) -> np.ndarray:
+        return np.load(self.directory / f"{name}.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(root: Path) -> bool:
+        return (Path(root) / MANIFEST_DIR / "meta.json").exists()
+
+    @classmethod
+    def write(
+        cls,
+        root: Path,
+        paths: Sequence[str],
+        labels: Sequence[int],
+        durations: Sequence[float],
+        sample_rates: Sequence[int],
+    ) -> "Manifest":
+        """Write a manifest for ``root``; ``paths`` are relative to it. Readers see the old or new version, never a mix."""
+        directory = Path(root) / MANIFEST_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        meta_path = directory / "meta.json"
+        if meta_path.exists():
+            meta_path.unlink()
+        encoded = [str(path).replace(os.sep, "/").encode("utf-8") for path in paths]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(blob) for blob in encoded], out=offsets[1:])
+        with (directory / ".paths.tmp").open("wb") as handle:
+            handle.write(b"".join(encoded))
+        os.replace(directory / ".paths.tmp", directory / "paths.bin")
+        _save_column(directory, "path_offset", offsets)
+        _save_column(directory, "label", np.asarray(labels, dtype=np.int8))
+        _save_column(directory, "duration", np.asarray(durations, dtype=np.float32))
+        _save_column(directory, "sample_rate", np.asarray(sample_rates, dtype=np.int32))
+        with meta_path.open("w", encoding="utf-8") as handle:
+            json.dump({"version": MANIFEST_VERSION, "count": len(encoded)}, handle)
+        return cls(root)
+
+    @classmethod
+    def index_directory(cls, root: Path) -> "Manifest":
+        """Build a manifest for an existing ``root/{real,fake}/*.wav`` tree from file headers."""
+        root = Path(root)
+        paths, labels, durations, rates = [], [], [], []
+        for label_name, target in LABEL_DIRS:
+            for wav in sorted((root / label_name).glob("*.wav")):
+                info = sf.info(str(wav))
+                paths.append(wav.relative_to(root).as_posix())
+                labels.append(target)
+                durations.append(info.frames / info.samplerate)
+                rates.append(info.samplerate)
+        return cls.write(root, paths, labels, durations, rates)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def path(self, idx: int) -> Path:
+        start, end = self.path_offsets[idx], self.path_offsets[idx + 1]
+        return self.root / self._paths[start:end].tobytes().decode("utf-8")
+
+    def class_counts(self) -> Tuple[int, int]:
+        """(real, fake)"""
+        counts = np.bincount(self.labels, minlength=2)
+        return int(counts[0]), int(counts[1])
+
+    def __getstate__(self):
+        # Re-open the memory maps in DataLoader workers rather than pickling arrays
+        return {"root": self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state["root"])
+
+
+class ManifestItems(Sequence):
+    """``DeepfakeDataset.items``-compatible ``(path, label)`` view over a manifest, built per access."""
+
+    def __init__(self, manifest: Manifest):
+        self.manifest = manifest
+
+    def __len__(self) -> int:
+        return len(self.manifest)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return self.manifest.path(idx), int(self.manifest.labels[idx])
+
+    def __iter__(self) -> Iterator[Tuple[Path, int]]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def balanced_weights(labels: np.ndarray) -> np.ndarray:
+    """Per-sample weights inversely proportional to class frequency (for ``WeightedRandomSampler``)."""
+    labels = np.asarray(labels)
+    neg, pos = np.bincount(labels, minlength=2)[:2]
+    return np.where(labels == 1, neg, pos).astype(np.float64)
+
+
+def split_indices(count: int, val_ratio: float, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Random (train, val) index arrays with ``max(int(count * val_ratio), 1)`` validation rows."""
+    val_len = max(int(count * val_ratio), 1)
+    order = np.random.default_rng(seed).permutation(count)
+    return np.sort(order[val_len:]), np.sort(order[:val_len])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a real/fake WAV tree into a columnar manifest")
+    parser.add_argument("roots", type=Path, nargs="+", help="Split directories, e.g. data/raw/train")
+    args = parser.parse_args()
+    for root in args.roots:
+        manifest = Manifest.index_directory(root)
+        real, fake = manifest.class_counts()
+        print(f"{root}: {len(manifest)} clips ({real} real, {fake} fake), "
+              f"{float(manifest.durations.sum()) / 3600:.1f} h")
+
+
+if __name__ == "__main__":
+    main()
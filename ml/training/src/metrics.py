@@ -0,0 +1,259 @@
+"""
+Anti-spoofing evaluation: EER, minimum DCF / t-DCF, ROC-AUC and per-attack breakdowns.
+
+Scores are MelCNN logits (higher = more likely fake). ``ScoreBuffer`` keeps
+them in a preallocated tensor on the evaluation device, so an evaluation
+loop does no host sync per batch. All metrics then come from one sort of the
+scores, following the DET-curve construction of the ASVspoof reference
+code, so scoring every epoch costs next to nothing. Per-attack numbers
+compare all bona fide clips against the spoofs of each attack id from the
+protocol file.
+
+Saved scores can be evaluated on their own: ``score.py`` CSVs (labels from
+``--metadata`` or the ``real``/``fake`` parent directory) or the
+``val_scores.npz`` that ``train.py`` writes next to its best checkpoint:
+
+    python metrics.py scores.csv --metadata ASVspoof2019.LA.cm.dev.trl.txt
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from protocol import LABEL_MAP, parse_metadata
+
+# ASVspoof 2019 t-DCF cost model (spoof prior 0.05; bona fide target/non-target split 0.99/0.01)
+TDCF_COST_MODEL = {
+    "Pspoof": 0.05,
+    "Ptar": (1 - 0.05) * 0.99,
+    "Pnon": (1 - 0.05) * 0.01,
+    "Cmiss_asv": 1,
+    "Cfa_asv": 10,
+    "Cmiss_cm": 1,
+    "Cfa_cm": 10,
+}
+# ASVspoof 5 minimum DCF costs: missing bona fide 1, accepting a spoof 10, spoof prior 0.05
+DCF_COST_MODEL = {"Pspoof": 0.05, "Cmiss": 1, "Cfa": 10}
+
+
+class ScoreBuffer:
+    """Logits, labels and summed loss accumulated on-device; read back once by ``numpy()``."""
+
+    def __init__(self, capacity: int, device: torch.device):
+        capacity = max(int(capacity), 1)
+        self.scores = torch.empty(capacity, dtype=torch.float32, device=device)
+        self.labels = torch.empty(capacity, dtype=torch.int8, device=device)
+        self.loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+        self.count = 0
+
+    def add(self, logits: torch.Tensor, labels: torch.Tensor, loss: torch.Tensor | None = None) -> None:
+        n = logits.shape[0]
+        if self.count + n > self.scores.numel():
+            self._grow(self.count + n)  # iterable datasets only know their length approximately
+        self.scores[self.count:self.count + n] = logits.detach().reshape(-1)
+        self.labels[self.count:self.count + n] = labels.reshape(-1)
+        if loss is not None:
+            self.loss_sum += loss.detach() * n
+        self.count += n
+
+    def _grow(self, needed: int) -> None:
+        capacity = max(needed, 2 * self.scores.numel())
+        for name in ("scores", "labels"):
+            old = getattr(self, name)
+            new = torch.empty(capacity, dtype=old.dtype, device=old.device)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def numpy(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        """(logits, labels, loss_sum) on the host."""
+        return (
+            self.scores[:self.count].cpu().numpy(),
+            self.labels[:self.count].cpu().numpy().astype(np.int64),
+            float(self.loss_sum),
+        )
+
+
+def det_curve(bonafide: np.ndarray, spoof: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Miss (bona fide rejected) and false-alarm (spoof accepted) rates at every
+    threshold, for countermeasure scores where higher means bona fide.
+    """
+    scores = np.concatenate([bonafide, spoof])
+    is_bonafide = np.concatenate([np.ones(bonafide.size), np.zeros(spoof.size)])
+    order = np.argsort(scores, kind="mergesort")
+    bonafide_below = np.cumsum(is_bonafide[order])
+    spoof_above = spoof.size - (np.arange(1, scores.size + 1) - bonafide_below)
+    miss = np.concatenate([[0.0], bonafide_below / bonafide.size])
+    false_alarm = np.concatenate([[1.0], spoof_above / spoof.size])
+    thresholds = np.concatenate([[scores[order[0]] - 1e-3], scores[order]])
+    return miss, false_alarm, thresholds
+
+
+def compute_eer(bonafide: np.ndarray, spoof: np.ndarray) -> Tuple[float, float]:
+    """(EER, threshold) for countermeasure scores (higher = bona fide)."""
+    miss, false_alarm, thresholds = det_curve(bonafide, spoof)
+    idx = int(np.argmin(np.abs(miss - false_alarm)))
+    return float((miss[idx] + false_alarm[idx]) / 2), float(thresholds[idx])
+
+
+def compute_min_dcf(bonafide: np.ndarray, spoof: np.ndarray, cost_model: Dict[str, float] = DCF_COST_MODEL) -> float:
+    """Normalised minimum detection cost over all thresholds."""
+    miss, false_alarm, _ = det_curve(bonafide, spoof)
+    c_miss = cost_model["Cmiss"] * (1 - cost_model["Pspoof"])
+    c_fa = cost_model["Cfa"] * cost_model["Pspoof"]
+    return float(np.min(c_miss * miss + c_fa * false_alarm) / min(c_miss, c_fa))
+
+
+@dataclass
+class AsvErrorRates:
+    """Error rates of the speaker verification system the countermeasure protects; zeros model a perfect ASV."""
+
+    pmiss: float = 0.0
+    pfa: float = 0.0
+    pmiss_spoof: float = 0.0
+
+
+def asv_error_rates(target: np.ndarray, nontarget: np.ndarray, spoof: np.ndarray) -> AsvErrorRates:
+    """ASV error rates at its own EER threshold, from ASV scores of target, non-target and spoofed trials."""
+    _, threshold = compute_eer(target, nontarget)
+    return AsvErrorRates(
+        pmiss=float(np.mean(target < threshold)),
+        pfa=float(np.mean(nontarget >= threshold)),
+        pmiss_spoof=float(np.mean(spoof < threshold)),
+    )
+
+
+def compute_min_tdcf(bonafide: np.ndarray, spoof: np.ndarray, asv: AsvErrorRates | None = None,
+                     cost_model: Dict[str, float] = TDCF_COST_MODEL) -> float:
+    """Normalised minimum tandem DCF (ASVspoof 2019 formulation)."""
+    asv = asv or AsvErrorRates()
+    c1 = cost_model["Ptar"] * (cost_model["Cmiss_cm"] - cost_model["Cmiss_asv"] * asv.pmiss) \
+        - cost_model["Pnon"] * cost_model["Cfa_asv"] * asv.pfa
+    c2 = cost_model["Cfa_cm"] * cost_model["Pspoof"] * (1 - asv.pmiss_spoof)
+    if c1 < 0 or c2 < 0:
+        raise ValueError("ASV error rates give a negative t-DCF weight; check the ASV operating point")
+    miss, false_alarm, _ = det_curve(bonafide, spoof)
+    return float(np.min(c1 * miss + c2 * false_alarm) / min(c1, c2))
+
+
+def compute_roc_auc(bonafide: np.ndarray, spoof: np.ndarray) -> float:
+    """Area under the ROC curve for detecting spoofs."""
+    miss, false_alarm, _ = det_curve(bonafide, spoof)
+    detected = 1 - false_alarm
+    return float(np.sum(np.diff(miss) * (detected[1:] + detected[:-1]) / 2))
+
+
+def split_scores(logits: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Countermeasure scores (negated logits, higher = bona fide) for the bona fide and spoof trials."""
+    scores = -np.asarray(logits, dtype=np.float64)
+    labels = np.asarray(labels)
+    return scores[labels == 0], scores[labels == 1]
+
+
+def summarize(logits: np.ndarray, labels: np.ndarray, attacks: Sequence[str] | None = None,
+              asv: AsvErrorRates | None = None) -> Dict:
+    """Every metric for one set of scores; rank-based ones are None when a class is missing."""
+    logits, labels = np.asarray(logits), np.asarray(labels)
+    report = {
+        "count": int(labels.size),
+        "accuracy": float(np.mean((logits > 0) == (labels == 1))) if labels.size else None,
+        "eer": None, "eer_threshold": None, "min_dcf": None, "min_tdcf": None, "roc_auc": None,
+    }
+    bonafide, spoof = split_scores(logits, labels)
+    if bonafide.size and spoof.size:
+        eer, threshold = compute_eer(bonafide, spoof)
+        report.update(
+            eer=eer,
+            eer_threshold=-threshold,  # as a logit: clips scoring above it are called fake
+            min_dcf=compute_min_dcf(bonafide, spoof),
+            min_tdcf=compute_min_tdcf(bonafide, spoof, asv),
+            roc_auc=compute_roc_auc(bonafide, spoof),
+        )
+    if attacks is not None and bonafide.size:
+        spoof_attacks = np.asarray(attacks)[labels == 1]
+        per_attack = {}
+        for attack in sorted(set(spoof_attacks.tolist()) - {"", "-"}):
+            attack_spoof = spoof[spoof_attacks == attack]
+            per_attack[attack] = {
+                "count": int(attack_spoof.size),
+                "eer": compute_eer(bonafide, attack_spoof)[0],
+                "min_tdcf": compute_min_tdcf(bonafide, attack_spoof, asv),
+            }
+        report["per_attack"] = per_attack
+    return report
+
+
+def attacks_for(paths: Sequence[Path], metadata: Path) -> np.ndarray:
+    """Attack id per path (matched on the file stem, as staged by ``split_asvspoof.py``); '' if unlisted."""
+    by_utt = {entry["utt_id"]: entry["attack"] for entry in parse_metadata(metadata)}
+    return np.array([by_utt.get(Path(path).stem, "") for path in paths])
+
+
+def load_scores(path: Path, metadata: Path | None = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """(logits, labels, attacks) from a ``val_scores.npz`` or a ``score.py`` CSV."""
+    if path.suffix == ".npz":
+        data = np.load(path)
+        attacks = data["attacks"] if "attacks" in data.files else None
+        logits, labels = data["logits"], data["labels"]
+        if metadata is not None and "paths" in data.files:
+            attacks = attacks_for(data["paths"], metadata)
+        return logits, labels, attacks
+    with path.open("r", encoding="utf-8", newline="") as handle:
+        rows = list(csv.DictReader(handle))
+    paths = [Path(row["path"]) for row in rows]
+    logits = np.array([float(row["logit"]) for row in rows], dtype=np.float32)
+    if metadata is not None:
+        keys = {entry["utt_id"]: LABEL_MAP.get(entry["label"]) for entry in parse_metadata(metadata)}
+        names = [keys.get(p.stem) for p in paths]
+        attacks = attacks_for(paths, metadata)
+    else:
+        names, attacks = [p.parent.name for p in paths], None
+    known = np.array([name in ("real", "fake") for name in names])
+    labels = np.array([1 if name == "fake" else 0 for name in names], dtype=np.int64)
+    return logits[known], labels[known], attacks[known] if attacks is not None else None
+
+
+def format_report(report: Dict) -> str:
+    def pct(value):
+        return f"{value:.2%}" if value is not None else "-"
+
+    def num(value):
+        return f"{value:.4f}" if value is not None else "-"
+
+    lines = [
+        f"clips {report['count']}  accuracy@0.5 {pct(report['accuracy'])}  EER {pct(report['eer'])} "
+        f"(logit threshold {num(report['eer_threshold'])})  min DCF {num(report['min_dcf'])}  "
+        f"min t-DCF {num(report['min_tdcf'])}  ROC-AUC {num(report['roc_auc'])}"
+    ]
+    for attack, row in report.get("per_attack", {}).items():
+        lines.append(f"  {attack:6s} n={row['count']:<6d} EER {pct(row['eer'])}  min t-DCF {num(row['min_tdcf'])}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scores", type=Path, help="score.py CSV or train.py val_scores.npz")
+    parser.add_argument("--metadata", type=Path, default=None, help="ASVspoof protocol file for labels and attacks")
+    parser.add_argument("--asv-pmiss", type=float, default=0.0, help="ASV miss rate at its operating point")
+    parser.add_argument("--asv-pfa", type=float, default=0.0, help="ASV false-alarm rate on non-targets")
+    parser.add_argument("--asv-pmiss-spoof", type=float, default=0.0, help="ASV rejection rate of spoofs")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    logits, labels, attacks = load_scores(args.scores, args.metadata)
+    report = summarize(logits, labels, attacks, AsvErrorRates(args.asv_pmiss, args.asv_pfa, args.asv_pmiss_spoof))
+    print(format_report(report))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+from typing import Optional
+
+import torch
 import torch.nn as nn
 
 class MelCNN(nn.Module):
@@ -26,5 +29,27 @@ class MelCNN(nn.Module):
             nn.Linear(64, 1)
         )
 
-    def forward(self, x):
-        return self.classifier(self.features(x)).squeeze(1)
+    def output_frames(self, frames: torch.Tensor) -> torch.Tensor:
+        """Time frames left after the pooling layers for inputs of ``frames`` frames."""
+        for layer in self.features:
+            if isinstance(layer, nn.MaxPool2d):
+                frames = torch.div(frames - layer.kernel_size, layer.stride, rounding_mode="floor") + 1
+        return frames
+
+    def forward(self, x: torch.Tensor, lengths: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        ``x`` is (batch, 1, n_mels, frames). With ``lengths`` (valid frames per
+        clip, for zero-padded variable-length batches) the final average pool
+        only covers each clip's own frames.
+        """
+        if lengths is None:
+            return self.classifier(self.features(x)).squeeze(1)
+        h = x
+        # Every layer but the final global pool (a sliced Sequential cannot be scripted)
+        for layer in self.features:
+            if not isinstance(layer, nn.AdaptiveAvgPool2d):
+                h = layer(h)
+        valid = self.output_frames(lengths.to(h.device)).clamp(1, h.shape[-1])
+        mask = torch.arange(h.shape[-1], device=h.device) < valid[:, None]
+        pooled = (h * mask[:, None, None, :]).sum(dim=(2, 3)) / (valid * h.shape[2])[:, None]
+        return self.classifier(pooled).squeeze(1)
@@ -1 +1,9 @@
+from models.compact import (
+    VARIANTS, CompactMelCNN, build_model, config_from_state_dict, count_parameters, load_checkpoint,
+    model_from_state_dict,
+)
 
+__all__ = [
+    "VARIANTS", "CompactMelCNN", "build_model", "config_from_state_dict", "count_parameters", "load_checkpoint",
+    "model_from_state_dict",
+]
@@ -0,0 +1,119 @@
+"""
+Configurable MelCNN family for on-device scoring.
+
+``CompactMelCNN`` keeps MelCNN's layout (three conv stages, 2x2 max pools
+between them, global average pool, two-layer classifier) and its forward
+pass, including masked pooling for variable-length batches, with two knobs:
+
+- ``width``: channel multiplier for every conv stage and the classifier's
+  hidden layer (channels are rounded to multiples of 8, at least 8);
+- ``depthwise``: stages after the first become depthwise-separable (3x3
+  depthwise conv + 1x1 pointwise conv, each with BatchNorm and ReLU).
+
+``CompactMelCNN()`` is exactly ``MelCNN`` (same modules and state_dict
+keys). The layers stay a flat Conv-BN-ReLU sequence, so
+``optimize_inference.fuse_melcnn`` and the exporters work unchanged.
+Checkpoints stay plain state_dicts: ``config_from_state_dict`` recovers the
+architecture from the weight shapes, so loaders need no extra metadata.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Sequence
+
+import torch
+import torch.nn as nn
+
+from model import MelCNN
+
+BASE_CHANNELS = (32, 64, 128)
+BASE_HIDDEN = 64
+
+VARIANTS: Dict[str, Dict] = {
+    "melcnn": {"width": 1.0, "depthwise": False},
+    "melcnn-0.75": {"width": 0.75, "depthwise": False},
+    "melcnn-0.5": {"width": 0.5, "depthwise": False},
+    "melcnn-0.25": {"width": 0.25, "depthwise": False},
+    "ds-melcnn": {"width": 1.0, "depthwise": True},
+    "ds-melcnn-0.75": {"width": 0.75, "depthwise": True},
+    "ds-melcnn-0.5": {"width": 0.5, "depthwise": True},
+    "ds-melcnn-0.25": {"width": 0.25, "depthwise": True},
+}
+
+
+def scaled(channels: int, width: float) -> int:
+    return max(8, int(round(channels * width / 8)) * 8)
+
+
+def conv_bn_relu(in_channels: int, out_channels: int, kernel_size: int = 3, groups: int = 1):
+    return [
+        nn.Conv2d(in_channels, out_channels, kernel_size, padding=kernel_size // 2, groups=groups),
+        nn.BatchNorm2d(out_channels),
+        nn.ReLU(),
+    ]
+
+
+class CompactMelCNN(MelCNN):
+    def __init__(self, channels: Sequence[int] = BASE_CHANNELS, hidden: int = BASE_HIDDEN, depthwise: bool = False):
+        super().__init__()
+        self.config = {"channels": list(channels), "hidden": hidden, "depthwise": depthwise}
+        layers = conv_bn_relu(1, channels[0])
+        for in_channels, out_channels in zip(channels[:-1], channels[1:]):
+            layers.append(nn.MaxPool2d(2))
+            if depthwise:
+                layers += conv_bn_relu(in_channels, in_channels, groups=in_channels)
+                layers += conv_bn_relu(in_channels, out_channels, kernel_size=1)
+            else:
+                layers += conv_bn_relu(in_channels, out_channels)
+        layers.append(nn.AdaptiveAvgPool2d((1, 1)))
+        # Replaces MelCNN's fixed-width layers; forward() and output_frames() are inherited
+        self.features = nn.Sequential(*layers)
+        self.classifier = nn.Sequential(
+            nn.Flatten(),
+            nn.Dropout(0.6),
+            nn.Linear(channels[-1], hidden),
+            nn.ReLU(),
+            nn.Dropout(0.4),
+            nn.Linear(hidden, 1),
+        )
+
+    @classmethod
+    def from_width(cls, width: float = 1.0, depthwise: bool = False) -> "CompactMelCNN":
+        return cls([scaled(c, width) for c in BASE_CHANNELS], scaled(BASE_HIDDEN, width), depthwise)
+
+
+def build_model(variant: str = "melcnn") -> CompactMelCNN:
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown model variant {variant!r}; expected one of {', '.join(VARIANTS)}")
+    return CompactMelCNN.from_width(**VARIANTS[variant])
+
+
+def config_from_state_dict(state: Dict[str, torch.Tensor]) -> Dict:
+    """
+    ``CompactMelCNN`` arguments for a (plain or BatchNorm-fused) state_dict,
+    read from its conv and linear weight shapes in order.
+    """
+    convs = [w for w in state.values() if w.dim() == 4]
+    linears = [w for k, w in state.items() if w.dim() == 2 and k.endswith("weight")]
+    if not convs or not linears:
+        raise ValueError("State dict does not look like a MelCNN checkpoint")
+    depthwise = any(w.shape[-1] == 1 for w in convs)
+    # Depthwise convs (one input channel per group, after the first stage) keep the width
+    channels = [convs[0].shape[0]] + [w.shape[0] for w in convs[1:] if w.shape[1] != 1]
+    return {"channels": channels, "hidden": linears[0].shape[0], "depthwise": depthwise}
+
+
+def model_from_state_dict(state: Dict[str, torch.Tensor]) -> CompactMelCNN:
+    model = CompactMelCNN(**config_from_state_dict(state))
+    model.load_state_dict(state)
+    return model
+
+
+def load_checkpoint(path: Path, map_location="cpu") -> CompactMelCNN:
+    """Any MelCNN-family state_dict (``melcnn.pt``, a student, ...) as an eval-mode model."""
+    return model_from_state_dict(torch.load(path, map_location=map_location)).eval()
+
+
+def count_parameters(model: nn.Module) -> int:
+    return sum(p.numel() for p in model.parameters())
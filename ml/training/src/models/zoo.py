@@ -0,0 +1,158 @@
+"""
+Model zoo table: parameters, compute and measured CPU latency of every
+MelCNN variant, plus validation accuracy/EER for trained checkpoints.
+
+Latency is the median single-clip (3 s, 64 x 188 log-mel) forward time of
+the BatchNorm-fused model, in eager PyTorch and ONNX Runtime, on
+``--threads`` CPU threads (default 1, roughly one phone core). Checkpoints
+are matched to their variant by architecture; ones that match none get
+their own row.
+
+    python -m models.zoo --budget-ms 1.0 --out zoo.json
+    python -m models.zoo --checkpoints ../../ml/model/melcnn.pt students/*.pt --val-data data/raw/dev
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from benchmarks.suites import timeit
+from dataset import N_MELS, TARGET_FRAMES, DeepfakeDataset
+from metrics import summarize
+from models.compact import (
+    VARIANTS, CompactMelCNN, build_model, config_from_state_dict, count_parameters, load_checkpoint,
+)
+from optimize_inference import fuse_melcnn
+
+
+def count_macs(model: nn.Module, frames: int = TARGET_FRAMES) -> int:
+    """Multiply-accumulates of the conv and linear layers for one clip of ``frames`` frames."""
+    macs = 0
+
+    def hook(module, inputs, output):
+        nonlocal macs
+        if isinstance(module, nn.Conv2d):
+            per_output = module.in_channels // module.groups * module.kernel_size[0] * module.kernel_size[1]
+            macs += output.numel() * per_output
+        else:
+            macs += module.in_features * module.out_features
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+    with torch.no_grad():
+        model.eval()(torch.zeros(1, 1, N_MELS, frames))
+    for handle in handles:
+        handle.remove()
+    return macs
+
+
+def onnx_latency_ms(model: nn.Module, mel: torch.Tensor, repeat: int, threads: int) -> float | None:
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "model.onnx"
+        torch.onnx.export(model, mel, path, input_names=["mel"], output_names=["logits"],
+                          dynamic_axes={"mel": {0: "batch", 3: "frames"}, "logits": {0: "batch"}}, opset_version=13)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        feed = {"mel": mel.numpy()}
+        return timeit(lambda: session.run(None, feed), repeat) * 1000
+
+
+def measure(model: nn.Module, repeat: int, threads: int) -> Dict:
+    fused = fuse_melcnn(model)
+    mel = torch.randn(1, 1, N_MELS, TARGET_FRAMES)
+    with torch.no_grad():
+        torch_ms = timeit(lambda: fused(mel), repeat) * 1000
+    params = count_parameters(model)
+    return {
+        "params": params,
+        "size_kb": params * 4 / 1024,
+        "mmacs": count_macs(model) / 1e6,
+        "torch_ms": torch_ms,
+        "onnx_ms": onnx_latency_ms(fused, mel, repeat, threads),
+    }
+
+
+def evaluate_checkpoint(model: nn.Module, val_data: Path, batch: int = 64) -> Dict:
+    dataset = DeepfakeDataset(val_data)
+    logits, labels = [], []
+    with torch.no_grad():
+        for mel, label in DataLoader(dataset, batch_size=batch):
+            logits.append(model(mel).float().numpy())
+            labels.append(label.numpy())
+    report = summarize(np.concatenate(logits), np.concatenate(labels))
+    return {"accuracy": report["accuracy"], "eer": report["eer"]}
+
+
+def build_rows(variants: List[str], checkpoints: List[Path], val_data: Path | None) -> List[Dict]:
+    rows = {name: {"model": name, "config": build_model(name).config, "checkpoint": None} for name in variants}
+    for path in checkpoints:
+        config = config_from_state_dict(torch.load(path, map_location="cpu"))
+        name = next((n for n in VARIANTS if build_model(n).config == config), path.stem)
+        row = rows.setdefault(name, {"model": name, "config": config})
+        row["checkpoint"] = str(path)
+        if val_data is not None:
+            row.update(evaluate_checkpoint(load_checkpoint(path), val_data))
+    return list(rows.values())
+
+
+def fastest_ms(row: Dict) -> float:
+    return min(ms for ms in (row["torch_ms"], row["onnx_ms"]) if ms is not None)
+
+
+def format_table(rows: List[Dict], budget_ms: float | None) -> str:
+    def cell(value, spec):
+        return "-" if value is None else format(value, spec)
+
+    header = ["model", "params", "size (KB)", "MMACs", "torch (ms)", "onnx (ms)", "accuracy", "EER"]
+    if budget_ms is not None:
+        header.append(f"<= {budget_ms:g} ms")
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for row in rows:
+        cells = [row["model"], f"{row['params']:,}", f"{row['size_kb']:.0f}", f"{row['mmacs']:.1f}",
+                 f"{row['torch_ms']:.2f}", cell(row["onnx_ms"], ".2f"), cell(row.get("accuracy"), ".3f"),
+                 cell(row.get("eer") and row["eer"] * 100, ".2f")]
+        if budget_ms is not None:
+            cells.append("yes" if fastest_ms(row) <= budget_ms else "no")
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--checkpoints", type=Path, nargs="*", default=[],
+                        help="Trained state_dicts to add accuracy/EER for (needs --val-data)")
+    parser.add_argument("--val-data", type=Path, default=None, help="real/ fake/ directory or staged split")
+    parser.add_argument("--threads", type=int, default=1, help="CPU threads for the latency runs")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed forward passes per model")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Mark which variants fit this latency")
+    parser.add_argument("--out", type=Path, default=None, help="Also write the rows as JSON")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    rows = build_rows(args.variants, args.checkpoints, args.val_data)
+    for row in rows:
+        row.update(measure(CompactMelCNN(**row["config"]), args.repeat, args.threads))
+    rows.sort(key=fastest_ms)
+    print(f"Single-clip CPU latency, {args.threads} thread(s), median of {args.repeat} runs")
+    print(format_table(rows, args.budget_ms))
+    if args.out:
+        args.out.write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Multi-crop (test-time) scoring of whole utterances.
+
+Evaluation normally scores one centre 3 s crop per clip. Here each
+utterance's log-mel is computed once, from one STFT of the full clip (a
+variable-length ``DeepfakeDataset`` batched with ``pad_collate``), and
+``crop_windows`` cuts up to ``crops`` evenly spaced, overlapping windows of
+TARGET_FRAMES frames out of it in frame space. All windows of a batch go
+through MelCNN in one forward pass and ``aggregate_crops`` reduces them to
+one logit per utterance:
+
+- ``logit``: mean of the window logits
+- ``mean``: mean of the window probabilities (returned as a logit)
+- ``max``: most-fake window
+
+A window starting at frame ``s`` covers the same samples as a 3 s crop
+starting at sample ``s * HOP_LENGTH``; only the frames at the clip edges
+differ slightly from cropping the waveform first (STFT centre padding).
+"""
+
+from __future__ import annotations
+
+import torch
+
+from dataset import TARGET_FRAMES, masked_normalize
+
+AGGREGATIONS = ("logit", "mean", "max")
+
+
+def crop_starts(frames: torch.Tensor, crops: int, window: int = TARGET_FRAMES) -> torch.Tensor:
+    """(batch, crops) window start frames spread evenly over each clip; one crop is the centre one."""
+    span = (frames - window).clamp(min=0).to(torch.float64)
+    if crops == 1:
+        fractions = torch.full((1,), 0.5, dtype=torch.float64)
+    else:
+        fractions = torch.linspace(0.0, 1.0, crops, dtype=torch.float64)
+    return torch.floor(span[:, None] * fractions.to(span.device)).long()
+
+
+def crop_windows(mel_db: torch.Tensor, frames: torch.Tensor, crops: int, window: int = TARGET_FRAMES):
+    """
+    Windows of a zero-padded (batch, 1, n_mels, time) log-mel batch with
+    ``frames`` valid frames per clip. Clips shorter than ``crops`` distinct
+    windows get fewer (a clip no longer than ``window`` gets one).
+
+    Returns ``(windows, window_frames, owner)``: (n, 1, n_mels, window)
+    windows, each normalised on its own like a training crop, their valid
+    frames (for MelCNN's masked pooling) and the clip index of each.
+    """
+    frames = frames.to(mel_db.device)
+    starts = crop_starts(frames, crops, window)
+    keep = torch.ones_like(starts, dtype=torch.bool)
+    keep[:, 1:] = starts[:, 1:] != starts[:, :-1]
+    owner, slot = keep.nonzero(as_tuple=True)
+    starts = starts[owner, slot]
+    if mel_db.shape[-1] < window:
+        mel_db = torch.nn.functional.pad(mel_db, (0, window - mel_db.shape[-1]))
+    # (batch, 1, n_mels, positions, window) view; indexing copies just the chosen windows
+    windows = mel_db.unfold(-1, window, 1)[owner, :, :, starts]
+    window_frames = (frames[owner] - starts).clamp(1, window)
+    return masked_normalize(windows, window_frames), window_frames, owner
+
+
+def aggregate_crops(logits: torch.Tensor, owner: torch.Tensor, batch_size: int, method: str = "logit") -> torch.Tensor:
+    """One logit per clip from the logits of its windows."""
+    logits = logits.float()
+    if method == "max":
+        out = torch.full((batch_size,), float("-inf"), device=logits.device)
+        return out.scatter_reduce(0, owner, logits, reduce="amax")
+    counts = torch.zeros(batch_size, device=logits.device).index_add_(0, owner, torch.ones_like(logits))
+    if method == "logit":
+        return torch.zeros(batch_size, device=logits.device).index_add_(0, owner, logits) / counts
+    if method == "mean":
+        probs = torch.zeros(batch_size, device=logits.device).index_add_(0, owner, torch.sigmoid(logits)) / counts
+        return torch.logit(probs, eps=1e-6)
+    raise ValueError(f"Unknown crop aggregation {method!r}; expected one of {AGGREGATIONS}")
@@ -0,0 +1,105 @@
+"""
+Inference-only MelCNN: fold BatchNorm into the preceding convs and fuse the
+ReLUs, then optionally script/compile the result.
+
+    python optimize_inference.py --checkpoint ../../ml/model/melcnn.pt --backend script
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import fuse_modules
+
+from dataset import N_MELS, TARGET_FRAMES
+from model import MelCNN
+from models import CompactMelCNN, config_from_state_dict, load_checkpoint
+
+
+def load_model(checkpoint: Path) -> MelCNN:
+    return load_checkpoint(checkpoint)
+
+
+def conv_bn_relu_groups(model: nn.Module):
+    """Names of every Conv2d -> BatchNorm2d (-> ReLU) run in ``model.features``."""
+    layers = list(model.features.named_children())
+    groups = []
+    for i, (name, layer) in enumerate(layers[:-1]):
+        if isinstance(layer, nn.Conv2d) and isinstance(layers[i + 1][1], nn.BatchNorm2d):
+            group = [f"features.{name}", f"features.{layers[i + 1][0]}"]
+            if i + 2 < len(layers) and isinstance(layers[i + 2][1], nn.ReLU):
+                group.append(f"features.{layers[i + 2][0]}")
+            groups.append(group)
+    return groups
+
+
+def fuse_melcnn(model: nn.Module) -> nn.Module:
+    """Return an eval-mode copy with BatchNorm folded into the convs and ReLUs fused."""
+    fused = copy.deepcopy(model).eval()
+    return fuse_modules(fused, conv_bn_relu_groups(fused))
+
+
+def load_fused(path: Path, backend: str = "eager") -> nn.Module:
+    """
+    Rebuild a fused model saved by ``--backend eager`` or ``compile``. Compiled
+    modules cannot be saved, so ``backend="compile"`` runs ``torch.compile``
+    on the loaded model.
+    """
+    state = torch.load(path, map_location="cpu")
+    model = fuse_melcnn(CompactMelCNN(**config_from_state_dict(state)))
+    model.load_state_dict(state)
+    model.eval()
+    return torch.compile(model) if backend == "compile" else model
+
+
+def check_equivalence(reference: nn.Module, optimized, *, batch: int = 4, frames: int = TARGET_FRAMES,
+                      atol: float = 1e-4) -> float:
+    """Compare logits on random log-mels; raises if they differ by more than ``atol``."""
+    mel = torch.randn(batch, 1, N_MELS, frames)
+    with torch.no_grad():
+        diff = (reference(mel) - optimized(mel)).abs().max().item()
+    if diff > atol:
+        raise ValueError(f"Optimized model deviates from reference by {diff:.2e} (atol {atol:.0e})")
+    return diff
+
+
+def optimize(model: nn.Module, backend: str = "eager") -> nn.Module:
+    fused = fuse_melcnn(model)
+    if backend == "script":
+        return torch.jit.freeze(torch.jit.script(fused))
+    if backend == "compile":
+        return torch.compile(fused)
+    return fused
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", type=Path, default=Path("../../ml/model/melcnn.pt"))
+    parser.add_argument("--out", type=Path, default=None,
+                        help="Artifact path (default: melcnn_fused.ts for script, melcnn_fused.pt otherwise)")
+    parser.add_argument("--backend", choices=["eager", "script", "compile"], default="script",
+                        help="script saves a frozen TorchScript module; eager/compile save fused weights "
+                             "(load them with load_fused(path, backend), which reapplies torch.compile)")
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    reference = load_model(args.checkpoint)
+    optimized = optimize(reference, args.backend)
+    diff = check_equivalence(reference, optimized, atol=args.atol)
+    print(f"Max |logit diff| vs unfused model: {diff:.2e}")
+
+    suffix = ".ts" if args.backend == "script" else ".pt"
+    out = args.out or args.checkpoint.with_name(f"melcnn_fused{suffix}")
+    if args.backend == "script":
+        torch.jit.save(optimized, str(out))
+    else:
+        torch.save(fuse_melcnn(reference).state_dict(), out)
+    print(f"Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,3 @@
+from preprocess.vad import frame_energy_db, trim_silence, vad_bounds
 
+__all__ = ["frame_energy_db", "trim_silence", "vad_bounds"]
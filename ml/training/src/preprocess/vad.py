@@ -0,0 +1,69 @@
+"""
+Frame-energy voice activity detection.
+
+Works on batches: waveforms are framed with ``unfold``, each frame's mean
+power is converted to dB once (one log per frame rather than per sample) and
+the first/last active frames give per-clip trim bounds in samples. Used by
+``preprocess_audio.py`` and, with ``vad=True``, by ``DeepfakeDataset`` so both
+trim identically.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+
+FRAME_LENGTH = 400  # 25 ms at 16 kHz
+FRAME_HOP = 160  # 10 ms
+THRESHOLD_DB = -40.0
+
+
+def frame_energy_db(wav: torch.Tensor, frame_length: int = FRAME_LENGTH, hop: int = FRAME_HOP) -> torch.Tensor:
+    """(batch, samples) -> (batch, frames) mean power per frame in dB; the tail is zero-padded to a whole frame."""
+    samples = wav.shape[-1]
+    frames = max(-(-(samples - frame_length) // hop), 0) + 1
+    pad = (frames - 1) * hop + frame_length - samples
+    if pad > 0:
+        wav = F.pad(wav, (0, pad))
+    power = wav.unfold(-1, frame_length, hop).pow(2).mean(dim=-1)
+    return 10 * torch.log10(power.clamp_min(1e-10))
+
+
+def vad_bounds(
+    wav: torch.Tensor,
+    lengths: torch.Tensor | Sequence[int] | None = None,
+    *,
+    threshold_db: float = THRESHOLD_DB,
+    frame_length: int = FRAME_LENGTH,
+    hop: int = FRAME_HOP,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Per-clip ``(start, end)`` sample bounds of the active region.
+
+    ``wav`` is (batch, samples) or (batch, 1, samples), right-padded when
+    ``lengths`` gives the true clip lengths. Clips without an active frame keep
+    their full length.
+    """
+    wav = wav.reshape(wav.shape[0], -1)
+    batch, samples = wav.shape
+    if lengths is None:
+        lengths = torch.full((batch,), samples, dtype=torch.long, device=wav.device)
+    lengths = torch.as_tensor(lengths, dtype=torch.long, device=wav.device)
+    energy = frame_energy_db(wav, frame_length, hop)
+    starts = torch.arange(energy.shape[1], device=wav.device) * hop
+    active = (energy > threshold_db) & (starts < lengths[:, None])
+    n_frames = active.shape[1]
+    first = active.int().argmax(dim=1)
+    last = n_frames - 1 - active.flip(1).int().argmax(dim=1)
+    found = active.any(dim=1)
+    start = torch.where(found, first * hop, torch.zeros_like(lengths))
+    end = torch.where(found, torch.minimum(last * hop + frame_length, lengths), lengths)
+    return start, end
+
+
+def trim_silence(wav: torch.Tensor, **kwargs) -> torch.Tensor:
+    """Trim leading/trailing silence from a single (channels, samples) waveform."""
+    start, end = vad_bounds(wav.reshape(1, -1) if wav.shape[0] == 1 else wav.mean(dim=0, keepdim=True), **kwargs)
+    return wav[:, int(start[0]): int(end[0])]
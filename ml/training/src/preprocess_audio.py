@@ -1,11 +1,15 @@
 import argparse
 from pathlib import Path
+from typing import List, Sequence
 
 import numpy as np
 import torch
-import torchaudio
-from torchaudio.functional import resample
 from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
+from tqdm import tqdm
+
+import audio_io
+from feature_store import FeatureStore
+from preprocess.vad import FRAME_HOP, FRAME_LENGTH, THRESHOLD_DB, trim_silence, vad_bounds
 
 SAMPLE_RATE = 16000
 CLIP_SECONDS = 3
@@ -19,49 +23,81 @@ mel_transform = MelSpectrogram(
 )
 amp_to_db = AmplitudeToDB()
 
-def simple_vad(waveform, threshold_db=-40.0):
-    energy = 20 * torch.log10(torch.clamp(torch.abs(waveform), min=1e-5))
-    mask = energy > threshold_db
-    if mask.any():
-        indices = mask.nonzero(as_tuple=True)[1]
-        return waveform[:, indices.min(): indices.max() + 1]
-    return waveform
+def simple_vad(waveform, threshold_db=THRESHOLD_DB):
+    return trim_silence(waveform, threshold_db=threshold_db)
 
-def load_and_process(path: Path):
-    wav, sr = torchaudio.load(path)
-    if sr != SAMPLE_RATE:
-        wav = resample(wav, orig_freq=sr, new_freq=SAMPLE_RATE)
-    if wav.shape[0] > 1:
-        wav = torch.mean(wav, dim=0, keepdim=True)
+def fix_length(wav):
+    # Pad or crop to fixed length
+    if wav.shape[-1] < TARGET_LEN:
+        return torch.nn.functional.pad(wav, (0, TARGET_LEN - wav.shape[-1]))
+    return wav[..., :TARGET_LEN]
+
+def normalized_log_mel(wav):
+    """Log-mel of a (1, samples) or (batch, 1, samples) waveform, normalised per clip."""
+    mel_db = amp_to_db(mel_transform(wav))
+    dims = tuple(range(mel_db.dim() - 3, mel_db.dim()))
+    return (mel_db - mel_db.mean(dim=dims, keepdim=True)) / (mel_db.std(dim=dims, keepdim=True) + 1e-5)
 
+def load_and_process(path: Path):
+    wav = audio_io.load(path, SAMPLE_RATE)
     wav = simple_vad(wav)
+    return normalized_log_mel(fix_length(wav))
 
-    # Pad or crop to fixed length
-    if wav.shape[1] < TARGET_LEN:
-        pad = TARGET_LEN - wav.shape[1]
-        wav = torch.nn.functional.pad(wav, (0, pad))
-    else:
-        wav = wav[:, :TARGET_LEN]
+def process_batch(paths: Sequence[Path]) -> List[torch.Tensor]:
+    """Batched ``load_and_process``: one VAD pass and one mel pass for all clips; returns (n_mels, frames) each."""
+    wavs = [audio_io.load(path, SAMPLE_RATE)[0] for path in paths]
+    lengths = torch.tensor([wav.shape[0] for wav in wavs])
+    padded = torch.nn.utils.rnn.pad_sequence(wavs, batch_first=True)
+    starts, ends = vad_bounds(padded, lengths)
+    batch = torch.stack([
+        fix_length(wav[start:end]) for wav, start, end in zip(wavs, starts.tolist(), ends.tolist())
+    ]).unsqueeze(1)
+    return list(normalized_log_mel(batch)[:, 0])
 
-    mel = mel_transform(wav)
-    mel_db = amp_to_db(mel)
-    mel_db = (mel_db - mel_db.mean()) / (mel_db.std() + 1e-5)
-    return mel_db
+def store_params():
+    return {
+        "pipeline": "preprocess_audio",
+        "sample_rate": SAMPLE_RATE,
+        "n_fft": mel_transform.n_fft,
+        "hop_length": mel_transform.hop_length,
+        "n_mels": mel_transform.n_mels,
+        "target_len": TARGET_LEN,
+        "vad": {"frame_length": FRAME_LENGTH, "hop": FRAME_HOP, "threshold_db": THRESHOLD_DB},
+    }
+
+def store_features(path: Path):
+    return load_and_process(path)[0]
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", type=Path, default=Path("data/raw"))
     parser.add_argument("--output", type=Path, default=Path("data/processed"))
+    parser.add_argument("--format", choices=["store", "pt"], default="store",
+                        help="Single memory-mapped feature store, or legacy one .pt file per clip")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes computing feature batches")
+    parser.add_argument("--batch-size", type=int, default=32, help="Clips per VAD/mel batch")
     args = parser.parse_args()
 
     args.output.mkdir(parents=True, exist_ok=True)
-    for label in ("real", "fake"):
-        out_dir = args.output / label
-        out_dir.mkdir(parents=True, exist_ok=True)
-        for wav in (args.input / label).glob("*.wav"):
-            mel = load_and_process(wav)
-            torch.save(mel, out_dir / f"{wav.stem}.pt")
-            print(f"Saved {out_dir / (wav.stem + '.pt')}")
+    items = [
+        (wav, target)
+        for label, target in (("real", 0), ("fake", 1))
+        for wav in sorted((args.input / label).glob("*.wav"))
+    ]
+    if args.format == "store":
+        FeatureStore.build(
+            args.output, items, store_features, store_params(),
+            compute_batch=process_batch, workers=args.workers, batch_size=args.batch_size,
+        )
+        return
+
+    for start in tqdm(range(0, len(items), args.batch_size), desc="Preprocessing"):
+        chunk = items[start:start + args.batch_size]
+        for (wav, target), mel in zip(chunk, process_batch([wav for wav, _ in chunk])):
+            out_dir = args.output / ("fake" if target else "real")
+            out_dir.mkdir(parents=True, exist_ok=True)
+            torch.save(mel.unsqueeze(0).clone(), out_dir / f"{wav.stem}.pt")
+    print(f"Saved {len(items)} clips under {args.output}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
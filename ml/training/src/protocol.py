@@ -0,0 +1,36 @@
+"""
+ASVspoof protocol (metadata) files.
+
+Each line names an utterance and ends with its key; the column before the key
+is the attack id (``A01``...``A19``, ``-`` for bona fide). In the 2019, 2021
+and ASVspoof 5 CM protocols the first column is the speaker and the second the
+utterance (``LA_0079 LA_T_1138215 - - bonafide``); two-column
+``<utt_id> <key>`` files are read as well.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterator
+
+LABEL_MAP = {
+    "bonafide": "real",
+    "genuine": "real",
+    "real": "real",
+    "spoof": "fake",
+    "fake": "fake",
+}
+
+
+def parse_metadata(path: Path) -> Iterator[Dict[str, str]]:
+    """Yield one entry per metadata line; the file is streamed, never held in memory."""
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            utt_id = parts[1] if len(parts) > 2 else parts[0]
+            label = parts[-1].lower()
+            attack = parts[-2] if len(parts) > 2 else "-"
+            yield {"utt_id": utt_id, "label": label, "attack": attack}
@@ -0,0 +1,215 @@
+"""
+Full-integer post-training quantization of MelCNN.
+
+Calibrates on log-mels drawn through DeepfakeDataset, writes int8 ONNX (and
+optionally TFLite) artifacts, then compares accuracy and batch-1 latency
+against the fp32 checkpoint.
+
+    python quantize.py --calibration-data data/raw/train --eval-data data/raw/dev --tflite
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+import torch
+
+from dataset import DeepfakeDataset
+from optimize_inference import fuse_melcnn, load_model
+
+
+def calibration_mels(data_root: Path, samples: int, seed: int = 0) -> List[np.ndarray]:
+    """Random (1, 1, n_mels, frames) log-mels from ``data_root``, processed exactly as in evaluation."""
+    dataset = DeepfakeDataset(data_root)
+    if len(dataset) == 0:
+        raise ValueError(f"No calibration audio under {data_root}")
+    order = np.random.default_rng(seed).permutation(len(dataset))[:samples]
+    return [dataset[int(i)][0].unsqueeze(0).numpy() for i in order]
+
+
+def export_fp32_onnx(model: torch.nn.Module, path: Path, example: np.ndarray) -> None:
+    torch.onnx.export(
+        model,
+        torch.from_numpy(example),
+        path,
+        input_names=["mel"],
+        output_names=["logits"],
+        dynamic_axes={"mel": {0: "batch", 3: "frames"}, "logits": {0: "batch"}},
+        opset_version=13,
+    )
+
+
+def quantize_onnx(fp32_path: Path, int8_path: Path, mels: List[np.ndarray]) -> None:
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class MelReader(CalibrationDataReader):
+        def __init__(self):
+            self._iter = iter(mels)
+
+        def get_next(self):
+            mel = next(self._iter, None)
+            return None if mel is None else {"mel": mel}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = Path(tmp) / "prepared.onnx"
+        quant_pre_process(str(fp32_path), str(prepared))
+        quantize_static(
+            str(prepared),
+            str(int8_path),
+            MelReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+        )
+
+
+def configure_int8_converter(converter, mels: List[np.ndarray]) -> None:
+    """Set up a ``tf.lite.TFLiteConverter`` for full-integer quantization calibrated on ``mels``."""
+    import tensorflow as tf
+
+    def representative_dataset():
+        for mel in mels:
+            yield [mel.astype(np.float32)]
+
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+
+def tflite_int8(onnx_path: Path, tflite_path: Path, mels: List[np.ndarray]) -> None:
+    import onnx
+    import tensorflow as tf
+    from onnx_tf.backend import prepare  # type: ignore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_model_dir = Path(tmp) / "saved_model"
+        prepare(onnx.load(str(onnx_path))).export_graph(str(saved_model_dir))
+        converter = tf.lite.TFLiteConverter.from_saved_model(str(saved_model_dir))
+        configure_int8_converter(converter, mels)
+        tflite_path.write_bytes(converter.convert())
+
+
+def _onnx_runner(path: Path) -> Callable[[np.ndarray], np.ndarray]:
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+    return lambda mel: session.run(None, {"mel": mel})[0]
+
+
+def _tflite_runner(path: Path) -> Callable[[np.ndarray], np.ndarray]:
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=str(path))
+    interpreter.allocate_tensors()
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+
+    def run(mel):
+        interpreter.set_tensor(inp["index"], mel)
+        interpreter.invoke()
+        return interpreter.get_tensor(out["index"])
+
+    return run
+
+
+def _torch_runner(model: torch.nn.Module) -> Callable[[np.ndarray], np.ndarray]:
+    def run(mel):
+        with torch.no_grad():
+            return model(torch.from_numpy(mel)).numpy()
+
+    return run
+
+
+def compare(runners: Dict[str, Callable], mels: List[np.ndarray], labels: List[int], warmup: int = 5) -> Dict:
+    """Accuracy, agreement with the first runner and batch-1 latency for each backend."""
+    report: Dict[str, Dict] = {}
+    reference = None
+    labels_arr = np.asarray(labels)
+    for name, run in runners.items():
+        for mel in mels[:warmup]:
+            run(mel)
+        logits, latencies = [], []
+        for mel in mels:
+            start = time.perf_counter()
+            logits.append(float(np.asarray(run(mel)).reshape(-1)[0]))
+            latencies.append((time.perf_counter() - start) * 1000)
+        logits_arr = np.asarray(logits)
+        preds = (logits_arr > 0).astype(int)
+        entry = {
+            "accuracy": float((preds == labels_arr).mean()),
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p90": float(np.percentile(latencies, 90)),
+        }
+        if reference is None:
+            reference = (logits_arr, preds)
+        else:
+            entry["agreement"] = float((preds == reference[1]).mean())
+            entry["max_logit_diff"] = float(np.abs(logits_arr - reference[0]).max())
+        report[name] = entry
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", type=Path, default=Path("../../ml/model/melcnn.pt"))
+    parser.add_argument("--calibration-data", type=Path, default=Path("data/raw/train"),
+                        help="Directory with real/ and fake/ WAVs used for calibration")
+    parser.add_argument("--calibration-samples", type=int, default=256)
+    parser.add_argument("--eval-data", type=Path, default=Path("data/raw/dev"),
+                        help="Directory with real/ and fake/ WAVs used for the comparison report")
+    parser.add_argument("--eval-samples", type=int, default=500)
+    parser.add_argument("--out-dir", type=Path, default=Path("../../ml/model"))
+    parser.add_argument("--tflite", action="store_true", help="Also build a full-integer TFLite model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    reference = load_model(args.checkpoint)
+    fused = fuse_melcnn(reference)
+    calibration = calibration_mels(args.calibration_data, args.calibration_samples, args.seed)
+
+    # Not melcnn.onnx: with the default --out-dir that is the deployed model, which this must not replace
+    fp32_onnx = args.out_dir / "melcnn_fp32.onnx"
+    int8_onnx = args.out_dir / "melcnn_int8.onnx"
+    export_fp32_onnx(fused, fp32_onnx, calibration[0])
+    quantize_onnx(fp32_onnx, int8_onnx, calibration)
+    print(f"int8 ONNX saved to {int8_onnx}")
+
+    runners = {"torch_fp32": _torch_runner(reference), "onnx_fp32": _onnx_runner(fp32_onnx),
+               "onnx_int8": _onnx_runner(int8_onnx)}
+    if args.tflite:
+        int8_tflite = args.out_dir / "melcnn_int8.tflite"
+        tflite_int8(fp32_onnx, int8_tflite, calibration)
+        print(f"int8 TFLite saved to {int8_tflite}")
+        runners["tflite_int8"] = _tflite_runner(int8_tflite)
+
+    eval_set = DeepfakeDataset(args.eval_data)
+    order = np.random.default_rng(args.seed + 1).permutation(len(eval_set))[:args.eval_samples]
+    samples = [eval_set[int(i)] for i in order]
+    mels = [mel.unsqueeze(0).numpy() for mel, _ in samples]
+    labels = [label for _, label in samples]
+    report = {
+        "checkpoint": str(args.checkpoint),
+        "calibration_samples": len(calibration),
+        "eval_samples": len(mels),
+        "size_bytes": {"onnx_fp32": fp32_onnx.stat().st_size, "onnx_int8": int8_onnx.stat().st_size},
+        "backends": compare(runners, mels, labels),
+    }
+    report_path = args.out_dir / "quantization_report.json"
+    report_path.write_text(json.dumps(report, indent=2))
+    for name, entry in report["backends"].items():
+        print(f"{name:12s} acc {entry['accuracy']:.3f}  p50 {entry['latency_ms_p50']:.2f} ms  "
+              f"p90 {entry['latency_ms_p90']:.2f} ms  agree {entry.get('agreement', 1.0):.3f}")
+    print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Bulk-score audio files with a MelCNN checkpoint or an exported ONNX model.
+
+Inputs may be directories (searched recursively), glob patterns or manifest
+files (.txt with one path per line, or .csv with a ``path`` column). Files are
+decoded in DataLoader workers, grouped into batches of similar length and
+written to CSV/Parquet as each batch finishes.
+
+    python score.py recordings/ --model ../../ml/model/melcnn.pt --out scores.csv
+    python score.py "calls/**/*.wav" --model ../../ml/model/melcnn_int8.onnx --out scores.parquet
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Sequence
+
+import numpy as np
+import soundfile as sf
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+
+from dataset import HOP_LENGTH, SAMPLE_RATE, TARGET_LEN, DeepfakeDataset
+from models import load_checkpoint
+
+AUDIO_EXTENSIONS = {".wav", ".flac", ".ogg", ".mp3", ".m4a"}
+
+
+def resolve_inputs(inputs: Sequence[str]) -> List[Path]:
+    paths: List[Path] = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            paths.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in AUDIO_EXTENSIONS))
+        elif path.suffix.lower() == ".csv":
+            with path.open("r", encoding="utf-8", newline="") as handle:
+                paths.extend(Path(row["path"]) for row in csv.DictReader(handle))
+        elif path.suffix.lower() == ".txt":
+            with path.open("r", encoding="utf-8") as handle:
+                paths.extend(Path(line.strip()) for line in handle if line.strip())
+        else:
+            paths.extend(Path(p) for p in sorted(glob.glob(item, recursive=True)))
+    return paths
+
+
+def probe_durations(paths: Sequence[Path], workers: int = 16) -> np.ndarray:
+    """Header-only duration lookup in seconds (-1 for unreadable files)."""
+
+    def duration(path: Path) -> float:
+        try:
+            info = sf.info(str(path))
+            return info.frames / info.samplerate
+        except Exception:
+            return -1.0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return np.fromiter(pool.map(duration, paths), dtype=np.float64, count=len(paths))
+
+
+def length_batches(durations: np.ndarray, max_batch: int, max_frames: int) -> List[List[int]]:
+    """Sort by duration and cut batches whose total frame count stays under ``max_frames``."""
+    frames = np.maximum(durations, TARGET_LEN / SAMPLE_RATE) * SAMPLE_RATE / HOP_LENGTH
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for idx in np.argsort(frames, kind="stable"):
+        if current and (len(current) >= max_batch or frames[idx] * (len(current) + 1) > max_frames):
+            batches.append(current)
+            current = []
+        current.append(int(idx))
+    if current:
+        batches.append(current)
+    return batches
+
+
+class ScoreDataset(Dataset):
+    def __init__(self, paths: Sequence[Path], max_seconds: float):
+        self.paths = list(paths)
+        self.max_len = int(max_seconds * SAMPLE_RATE)
+        self.processor = DeepfakeDataset(None, items=[])
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        wav = self.processor.load(self.paths[idx])
+        seconds = wav.shape[1] / SAMPLE_RATE
+        if wav.shape[1] > self.max_len:
+            start = (wav.shape[1] - self.max_len) // 2
+            wav = wav[:, start:start + self.max_len]
+        elif wav.shape[1] < TARGET_LEN:
+            wav = F.pad(wav, (0, TARGET_LEN - wav.shape[1]))
+        mel_db = self.processor.log_mel(wav)
+        mel_db = (mel_db - mel_db.mean()) / (mel_db.std() + 1e-5)
+        return mel_db, idx, seconds
+
+
+def collate_padded(batch):
+    """Zero-pad a length-sorted batch to its longest clip; ``lengths`` holds each clip's valid frames."""
+    lengths = torch.tensor([mel.shape[-1] for mel, _, _ in batch])
+    mels = torch.stack([F.pad(mel, (0, int(lengths.max()) - mel.shape[-1])) for mel, _, _ in batch])
+    return mels, lengths, [idx for _, idx, _ in batch], [seconds for _, _, seconds in batch]
+
+
+class TorchScorer:
+    def __init__(self, checkpoint: Path, device: torch.device):
+        self.device = device
+        self.model = load_checkpoint(checkpoint).to(device)
+
+    def __call__(self, mels: torch.Tensor, lengths: torch.Tensor | None = None) -> np.ndarray:
+        """With ``lengths``, padded frames are masked out of the pooling."""
+        with torch.no_grad():
+            return self.model(mels.to(self.device, non_blocking=True), lengths).float().cpu().numpy()
+
+
+class OnnxScorer:
+    def __init__(self, path: Path):
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(str(path), providers=ort.get_available_providers())
+        self.input_name = self.session.get_inputs()[0].name
+        # Older exports (export_onnx.py) pin the batch dimension to 1
+        self.fixed_batch = isinstance(self.session.get_inputs()[0].shape[0], int)
+
+    def __call__(self, mels: torch.Tensor, lengths: torch.Tensor | None = None) -> np.ndarray:
+        # The exported graph has no mask input: trim the batch to its shortest clip (at most a bucket's width)
+        if lengths is not None:
+            mels = mels[..., :int(lengths.min())]
+        batch = mels.numpy()
+        if self.fixed_batch:
+            return np.concatenate([self.session.run(None, {self.input_name: m[None]})[0].reshape(-1) for m in batch])
+        return self.session.run(None, {self.input_name: batch})[0].reshape(-1)
+
+
+class ResultWriter:
+    """Append rows to CSV or Parquet as batches complete."""
+
+    COLUMNS = ("path", "duration_s", "logit", "probability", "prediction")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.parquet = path.suffix.lower() == ".parquet"
+        if self.parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as exc:
+                raise SystemExit("Parquet output needs pyarrow (pip install pyarrow)") from exc
+            self._pa = pa
+            schema = pa.schema([("path", pa.string()), ("duration_s", pa.float64()), ("logit", pa.float64()),
+                                ("probability", pa.float64()), ("prediction", pa.string())])
+            self._writer = pq.ParquetWriter(str(path), schema)
+        else:
+            self._handle = path.open("w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._handle)
+            self._writer.writerow(self.COLUMNS)
+
+    def write(self, rows: List[tuple]) -> None:
+        if self.parquet:
+            columns = list(zip(*rows))
+            self._writer.write_table(
+                self._pa.table({name: list(col) for name, col in zip(self.COLUMNS, columns)}, schema=self._writer.schema)
+            )
+        else:
+            self._writer.writerows(rows)
+            self._handle.flush()
+
+    def close(self) -> None:
+        if self.parquet:
+            self._writer.close()
+        else:
+            self._handle.close()
+
+
+def score_batches(loader: DataLoader, scorer, paths: Sequence[Path], threshold: float) -> Iterator[List[tuple]]:
+    for mels, lengths, indices, seconds in loader:
+        logits = scorer(mels, lengths)
+        probs = 1.0 / (1.0 + np.exp(-logits))
+        yield [
+            (str(paths[i]), round(sec, 3), float(logit), float(prob), "fake" if prob >= threshold else "real")
+            for i, sec, logit, prob in zip(indices, seconds, logits, probs)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns or .txt/.csv manifests")
+    parser.add_argument("--model", type=Path, default=Path("../../ml/model/melcnn.pt"),
+                        help="PyTorch checkpoint (.pt) or exported ONNX model (.onnx)")
+    parser.add_argument("--out", type=Path, default=Path("scores.csv"), help="Output .csv or .parquet")
+    parser.add_argument("--workers", type=int, default=4, help="Decode/feature worker processes")
+    parser.add_argument("--batch", type=int, default=64, help="Maximum clips per batch")
+    parser.add_argument("--max-batch-frames", type=int, default=64 * 188 * 4,
+                        help="Frame budget per batch; long clips get smaller batches")
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="Score at most this much of each clip")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    paths = resolve_inputs(args.inputs)
+    if not paths:
+        raise SystemExit("No audio files found")
+    durations = probe_durations(paths)
+    unreadable = [p for p, d in zip(paths, durations) if d < 0]
+    for path in unreadable:
+        print(f"Skipping unreadable file {path}")
+    keep = durations >= 0
+    paths = [p for p, ok in zip(paths, keep) if ok]
+    durations = np.minimum(durations[keep], args.max_seconds)
+
+    if args.model.suffix == ".onnx":
+        scorer = OnnxScorer(args.model)
+    else:
+        scorer = TorchScorer(args.model, torch.device("cuda" if torch.cuda.is_available() else "cpu"))
+
+    loader = DataLoader(
+        ScoreDataset(paths, args.max_seconds),
+        batch_sampler=length_batches(durations, args.batch, args.max_batch_frames),
+        collate_fn=collate_padded,
+        num_workers=args.workers,
+        pin_memory=torch.cuda.is_available(),
+    )
+    writer = ResultWriter(args.out)
+    scored = 0
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    try:
+        for rows in score_batches(loader, scorer, paths, args.threshold):
+            writer.write(rows)
+            scored += len(rows)
+            audio_seconds += sum(min(row[1], args.max_seconds) for row in rows)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} clips ({audio_seconds:.0f}s of audio) in {elapsed:.1f}s: "
+          f"{scored / max(elapsed, 1e-9):.1f} clips/s, real-time factor {elapsed / max(audio_seconds, 1e-9):.4f}")
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
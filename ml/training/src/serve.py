@@ -0,0 +1,306 @@
+"""
+Local inference service for MelCNN (PyTorch checkpoint or exported ONNX).
+
+The model is loaded once. Each request's audio is turned into a log-mel by
+``preprocess_audio.load_and_process`` (VAD, 3 s crop/pad, per-clip
+normalisation) in a process pool. The mels go onto one thread-safe queue,
+where a batching thread coalesces concurrent requests into micro-batches:
+a batch is scored when it reaches ``--max-batch`` or when its oldest
+request has waited ``--max-latency-ms``.
+
+    python serve.py --model ../../ml/model/melcnn.pt --port 8080
+    curl --data-binary @clip.wav http://127.0.0.1:8080/score
+    curl http://127.0.0.1:8080/metrics
+
+Endpoints: ``POST /score`` (body: any audio file soundfile can read),
+``GET /metrics`` (request latency p50/p90/p99, feature/queue/inference
+times, batch-size histogram), ``POST /metrics/reset``, ``GET /healthz``.
+Use ``loadgen.py`` to load-test it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from preprocess_audio import load_and_process
+from score import OnnxScorer, TorchScorer
+
+
+def extract_features(audio: bytes) -> np.ndarray:
+    """(1, n_mels, frames) log-mel of an encoded audio file, exactly as ``preprocess_audio`` computes it."""
+    return load_and_process(io.BytesIO(audio)).numpy()
+
+
+class InvalidAudioError(ValueError):
+    """The request body could not be decoded as audio (reported to the client as HTTP 400)."""
+
+
+def _init_worker() -> None:
+    # One process per core already; stop each worker from spawning its own pool.
+    torch.set_num_threads(1)
+
+
+def percentiles(values) -> Dict[str, float] | None:
+    if not values:
+        return None
+    arr = np.fromiter(values, dtype=np.float64)
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {"p50": float(p50), "p90": float(p90), "p99": float(p99),
+            "mean": float(arr.mean()), "max": float(arr.max())}
+
+
+class ServerStats:
+    """Latency and batch-size statistics over the last ``window`` requests / batches."""
+
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.perf_counter()
+            self.requests = self.errors = 0
+            self.latency_ms = deque(maxlen=self.window)
+            self.feature_ms = deque(maxlen=self.window)
+            self.queue_ms = deque(maxlen=self.window)
+            self.inference_ms = deque(maxlen=self.window)
+            self.batch_sizes: Counter = Counter()
+
+    def record_request(self, latency_ms: float, feature_ms: float, queue_ms: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.latency_ms.append(latency_ms)
+            self.feature_ms.append(feature_ms)
+            self.queue_ms.append(queue_ms)
+
+    def record_batch(self, size: int, inference_ms: float) -> None:
+        with self._lock:
+            self.batch_sizes[size] += 1
+            self.inference_ms.append(inference_ms)
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            batches = sum(self.batch_sizes.values())
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "elapsed_s": elapsed,
+                "requests_per_s": self.requests / max(elapsed, 1e-9),
+                "latency_ms": percentiles(self.latency_ms),
+                "feature_ms": percentiles(self.feature_ms),
+                "queue_ms": percentiles(self.queue_ms),
+                "inference_ms": percentiles(self.inference_ms),
+                "batches": batches,
+                "mean_batch_size": sum(k * v for k, v in self.batch_sizes.items()) / max(batches, 1),
+                "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+            }
+
+
+@dataclass
+class _Pending:
+    mel: np.ndarray
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatcher:
+    """
+    Single scoring thread fed by a queue. It blocks for the first request,
+    then keeps collecting until ``max_batch`` requests or until that request
+    has waited ``max_latency_s``; requests already queued at the deadline
+    still join the batch. Futures resolve to ``(logit, batch_size, queue_ms)``.
+    """
+
+    def __init__(self, scorer, max_batch: int, max_latency_s: float, stats: ServerStats):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_latency_s = max_latency_s
+        self.stats = stats
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, mel: np.ndarray) -> Future:
+        pending = _Pending(mel)
+        self._queue.put(pending)
+        return pending.future
+
+    def _collect(self) -> List[_Pending] | None:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.enqueued + self.max_latency_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # finish this batch, stop on the next call
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while (batch := self._collect()) is not None:
+            started = time.perf_counter()
+            try:
+                logits = self.scorer(torch.from_numpy(np.stack([item.mel for item in batch])))
+            except Exception as exc:
+                for item in batch:
+                    item.future.set_exception(exc)
+                continue
+            self.stats.record_batch(len(batch), (time.perf_counter() - started) * 1000)
+            for item, logit in zip(batch, logits):
+                item.future.set_result((float(logit), len(batch), (started - item.enqueued) * 1000))
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+class InferenceService:
+    def __init__(self, model: Path, device: torch.device, max_batch: int, max_latency_ms: float,
+                 feature_workers: int, threshold: float = 0.5, timeout_s: float = 30.0):
+        self.threshold = threshold
+        self.timeout_s = timeout_s
+        self.stats = ServerStats()
+        # Spawned (not forked) so workers don't inherit the batching thread or torch's thread pools
+        self.pool = ProcessPoolExecutor(
+            max_workers=feature_workers, mp_context=mp.get_context("spawn"), initializer=_init_worker,
+        ) if feature_workers > 0 else None
+        scorer = OnnxScorer(model) if model.suffix == ".onnx" else TorchScorer(model, device)
+        self.batcher = MicroBatcher(scorer, max_batch, max_latency_ms / 1000, self.stats)
+
+    def score(self, audio: bytes) -> Dict:
+        started = time.perf_counter()
+        try:
+            try:
+                if self.pool is not None:
+                    mel = self.pool.submit(extract_features, audio).result(timeout=self.timeout_s)
+                else:
+                    mel = extract_features(audio)
+            except (sf.SoundFileError, ValueError) as exc:
+                raise InvalidAudioError(f"Could not decode audio: {exc}") from exc
+            featurized = time.perf_counter()
+            logit, batch_size, queue_ms = self.batcher.submit(mel).result(timeout=self.timeout_s)
+        except Exception:
+            self.stats.record_error()
+            raise
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.stats.record_request(latency_ms, (featurized - started) * 1000, queue_ms)
+        probability = 1.0 / (1.0 + np.exp(-logit))
+        return {
+            "logit": logit,
+            "probability": probability,
+            "prediction": "fake" if probability >= self.threshold else "real",
+            "batch_size": batch_size,
+            "latency_ms": latency_ms,
+        }
+
+    def close(self) -> None:
+        self.batcher.close()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so load tests measure scoring rather than TCP setup
+    server_version = "MelCNNServe/1.0"
+
+    def _reply(self, status: int, body: Dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._reply(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._reply(200, self.server.service.stats.snapshot())
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        audio = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/metrics/reset":
+            self.server.service.stats.reset()
+            self._reply(200, {"status": "reset"})
+        elif self.path != "/score":
+            self._reply(404, {"error": f"unknown path {self.path}"})
+        elif not audio:
+            self._reply(400, {"error": "empty body; POST the audio file"})
+        else:
+            try:
+                self._reply(200, self.server.service.score(audio))
+            except Exception as exc:
+                # Only undecodable input is the client's fault; scoring failures are the server's
+                self._reply(400 if isinstance(exc, InvalidAudioError) else 500,
+                            {"error": f"{type(exc).__name__}: {exc}"})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", type=Path, default=Path("../../ml/model/melcnn.pt"), help=".pt or .onnx")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-latency-ms", type=float, default=10.0,
+                        help="Longest a request waits for its batch to fill")
+    parser.add_argument("--feature-workers", type=int, default=2,
+                        help="Feature extraction processes (0: extract on the request thread)")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    service = InferenceService(args.model, torch.device(args.device), args.max_batch, args.max_latency_ms,
+                               args.feature_workers, args.threshold)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = args.verbose
+    print(f"Serving {args.model} on http://{args.host}:{server.server_port} "
+          f"(max batch {args.max_batch}, max wait {args.max_latency_ms:g} ms, {args.feature_workers} feature workers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Sharded, sequential-read dataset format.
+
+Each shard is a plain (uncompressed) tar file holding consecutive
+``<key>.wav`` / ``<key>.json`` pairs, WebDataset style, and ``index.json``
+records the shards with their per-class counts. Reading a shard is one
+sequential stream instead of one open() per clip.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import random
+import tarfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from torch.utils.data import IterableDataset, get_worker_info
+
+from dataset import SAMPLE_RATE, DeepfakeDataset
+
+INDEX_FILE = "index.json"
+LABEL_NAMES = ("real", "fake")
+
+
+class ShardWriter:
+    """Append samples to ``shard-NNNNN.tar`` files, rolling over by count or size."""
+
+    def __init__(self, out_dir: Path, max_count: int = 2000, max_bytes: int = 256 * 1024 * 1024):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.shards: List[Dict] = []
+        self._tar: tarfile.TarFile | None = None
+        self._bytes = 0
+
+    def _roll(self) -> None:
+        self._close_shard()
+        name = f"shard-{len(self.shards):05d}.tar"
+        self._tar = tarfile.open(self.out_dir / name, "w")
+        self._bytes = 0
+        self.shards.append({"name": name, "count": 0, "real": 0, "fake": 0})
+
+    def _close_shard(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+
+    def _add(self, name: str, payload: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(payload)
+        self._tar.addfile(info, io.BytesIO(payload))
+        self._bytes += len(payload)
+
+    def write(self, key: str, audio: bytes, meta: Dict) -> None:
+        """Add one clip; ``meta`` must carry an integer ``label`` (0 real, 1 fake)."""
+        current = self.shards[-1] if self.shards else None
+        if current is None or current["count"] >= self.max_count or self._bytes >= self.max_bytes:
+            self._roll()
+            current = self.shards[-1]
+        self._add(f"{key}.wav", audio)
+        self._add(f"{key}.json", json.dumps(meta).encode("utf-8"))
+        current["count"] += 1
+        current[LABEL_NAMES[meta["label"]]] += 1
+
+    def close(self) -> None:
+        self._close_shard()
+        index = {
+            "shards": self.shards,
+            "total": sum(s["count"] for s in self.shards),
+            "real": sum(s["real"] for s in self.shards),
+            "fake": sum(s["fake"] for s in self.shards),
+        }
+        with (self.out_dir / INDEX_FILE).open("w", encoding="utf-8") as handle:
+            json.dump(index, handle, indent=2)
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_shard(path: Path) -> Iterator[Tuple[bytes, Dict]]:
+    """Yield (wav_bytes, meta) pairs from one shard in a single sequential pass."""
+    pending: Dict[str, Dict] = {}
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, _, ext = member.name.rpartition(".")
+            payload = tar.extractfile(member).read()
+            entry = pending.setdefault(key, {})
+            entry[ext] = payload
+            if "wav" in entry and "json" in entry:
+                del pending[key]
+                yield entry["wav"], json.loads(entry["json"])
+
+
+class ShardedDataset(IterableDataset):
+    """
+    Streams samples from a shard directory written by ``ShardWriter``.
+
+    Shards are reshuffled every epoch (call ``set_epoch``) and divided between
+    distributed ranks, then DataLoader workers; samples pass through a shuffle buffer. With
+    ``balance=True`` each sample is emitted a random number of times whose
+    expectation equalises the classes, matching the behaviour of
+    ``WeightedRandomSampler`` with replacement over an epoch.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        sample_rate: int = SAMPLE_RATE,
+        *,
+        augment: bool = False,
+        raw_waveform: bool = False,
+        vad: bool = False,
+        shuffle: bool | None = None,
+        shuffle_buffer: int = 1000,
+        balance: bool = False,
+        seed: int = 0,
+        rank: int = 0,
+        world_size: int = 1,
+    ):
+        self.root = Path(root)
+        with (self.root / INDEX_FILE).open("r", encoding="utf-8") as handle:
+            self.index = json.load(handle)
+        self.shards = [self.root / shard["name"] for shard in self.index["shards"]]
+        self.processor = DeepfakeDataset(
+            self.root, sample_rate, items=[], augment=augment, raw_waveform=raw_waveform, vad=vad
+        )
+        self.shuffle = augment if shuffle is None else shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.balance = balance
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def class_counts(self) -> Tuple[int, int]:
+        return self.index["real"], self.index["fake"]
+
+    def __len__(self):
+        # Approximate per-rank share; shards are split whole across ranks
+        return -(-self.index["total"] // self.world_size)
+
+    def _emit_rates(self) -> Tuple[float, float]:
+        real, fake = self.class_counts()
+        if not self.balance or not real or not fake:
+            return 1.0, 1.0
+        total = real + fake
+        return total / (2 * real), total / (2 * fake)
+
+    def _samples(self, shards: List[Path], rng: random.Random) -> Iterator[Tuple[bytes, Dict]]:
+        rates = self._emit_rates()
+        for shard in shards:
+            for audio, meta in iter_shard(shard):
+                rate = rates[meta["label"]]
+                copies = int(rate) + (rng.random() < rate - int(rate))
+                for _ in range(copies):
+                    yield audio, meta
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        shards = list(self.shards)
+        if self.shuffle:
+            rng.shuffle(shards)
+        # Every rank shuffles identically above, then takes its own shards
+        shards = shards[self.rank::self.world_size]
+        worker = get_worker_info()
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+        if worker is not None or self.world_size > 1:
+            worker_id = worker.id if worker is not None else 0
+            rng = random.Random(self.seed + self.epoch * 1000 + self.rank * 100 + worker_id + 1)
+
+        buffer: List[Tuple[bytes, Dict]] = []
+        for sample in self._samples(shards, rng):
+            if not self.shuffle:
+                yield self._decode(sample)
+                continue
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            slot = rng.randrange(len(buffer))
+            buffer[slot], sample = sample, buffer[slot]
+            yield self._decode(sample)
+        rng.shuffle(buffer)
+        for sample in buffer:
+            yield self._decode(sample)
+
+    def _decode(self, sample: Tuple[bytes, Dict]):
+        audio, meta = sample
+        return self.processor.process(io.BytesIO(audio), meta["label"])
@@ -0,0 +1,182 @@
+"""
+Streaming MelCNN scoring for arbitrarily long call audio.
+
+Audio arrives in chunks of any size. ``StreamingMel`` keeps only the STFT
+overlap (< n_fft samples) between calls and computes just the new mel columns;
+``StreamingScorer`` keeps the last window of columns and scores it every
+``hop_seconds``. Memory is bounded by one window regardless of call length.
+
+    python streaming.py --checkpoint ../../ml/model/melcnn.pt --audio call.wav --hop 0.5
+"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import torch
+import torchaudio
+
+import audio_io
+from dataset import HOP_LENGTH, N_FFT, N_MELS, SAMPLE_RATE, TARGET_FRAMES
+from models import load_checkpoint
+
+
+class StreamingMel:
+    """
+    Incremental log-mel matching ``MelSpectrogram(center=False)`` + ``AmplitudeToDB``.
+
+    Only the first/last frames of a whole-file ``center=True`` spectrogram differ
+    (reflection padding needs future samples).
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH,
+                 n_mels: int = N_MELS):
+        reference = torchaudio.transforms.MelSpectrogram(
+            sample_rate=sample_rate, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels
+        )
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.window = torch.hann_window(n_fft)
+        self.fb = reference.mel_scale.fb  # (n_freqs, n_mels)
+        self.to_db = torchaudio.transforms.AmplitudeToDB()
+        self._pending = torch.zeros(0)
+
+    def reset(self) -> None:
+        self._pending = torch.zeros(0)
+
+    def push(self, samples: torch.Tensor) -> torch.Tensor:
+        """Consume 1-D ``samples``; returns the (n_mels, new_frames) log-mel columns they complete."""
+        buf = torch.cat([self._pending, samples.float().reshape(-1)])
+        n_frames = (buf.numel() - self.n_fft) // self.hop_length + 1 if buf.numel() >= self.n_fft else 0
+        if n_frames <= 0:
+            self._pending = buf
+            return torch.zeros(self.fb.shape[1], 0)
+        frames = buf.unfold(0, self.n_fft, self.hop_length)[:n_frames]
+        power = torch.fft.rfft(frames * self.window).abs().pow(2)
+        self._pending = buf[n_frames * self.hop_length:].clone()
+        return self.to_db((power @ self.fb).T)
+
+    def flush(self) -> torch.Tensor:
+        """The final, zero-padded frame of leftover samples (none if there are none)."""
+        if self._pending.numel() == 0:
+            return torch.zeros(self.fb.shape[1], 0)
+        return self.push(torch.zeros(self.n_fft - self._pending.numel() % self.n_fft))[:, -1:]
+
+
+@dataclass
+class WindowScore:
+    start: float  # seconds from call start
+    end: float
+    probability: float
+    smoothed: float
+
+
+class StreamingScorer:
+    """Sliding-window MelCNN scores over a live call, with an EMA call-level score."""
+
+    def __init__(self, model: torch.nn.Module, *, sample_rate: int = SAMPLE_RATE, window_frames: int = TARGET_FRAMES,
+                 hop_seconds: float = 1.0, smoothing: float = 0.3, device: str = "cpu"):
+        self.model = model.to(device).eval()
+        self.device = device
+        self.sample_rate = sample_rate
+        self.mel = StreamingMel(sample_rate)
+        self.window_frames = window_frames
+        self.hop_frames = max(1, round(hop_seconds * sample_rate / HOP_LENGTH))
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self) -> None:
+        self.mel.reset()
+        self._columns = torch.zeros(N_MELS, 0)
+        self._total_frames = 0
+        self._since_score = 0
+        self.call_score: float | None = None
+        self.windows_scored = 0
+
+    def push(self, audio, sample_rate: int | None = None) -> List[WindowScore]:
+        """Feed mono samples (numpy or tensor); returns scores for every window completed by them."""
+        if sample_rate is not None and sample_rate != self.sample_rate:
+            raise ValueError(f"Expected {self.sample_rate} Hz audio, got {sample_rate} Hz")
+        new = self.mel.push(torch.as_tensor(np.asarray(audio, dtype=np.float32)))
+        windows, ends = [], []
+        # Walk the new columns hop by hop so a large chunk still yields every window
+        offset = 0
+        while offset < new.shape[1]:
+            step = min(max(self.hop_frames - self._since_score, 1), new.shape[1] - offset)
+            self._columns = torch.cat([self._columns, new[:, offset:offset + step]], dim=1)[:, -self.window_frames:]
+            offset += step
+            self._total_frames += step
+            self._since_score += step
+            if self._columns.shape[1] == self.window_frames and self._since_score >= self.hop_frames:
+                windows.append(self._columns)
+                ends.append(self._total_frames)
+                self._since_score = 0
+        return self._score(windows, ends)
+
+    def flush(self) -> List[WindowScore]:
+        """Score the partial window, padded at its quietest level, if the call ended before a full one."""
+        if self.windows_scored:
+            return []
+        if self._columns.shape[1] == 0:
+            # Call shorter than one FFT window: score its single zero-padded frame
+            self._columns = self.mel.flush()
+            self._total_frames += self._columns.shape[1]
+        if self._columns.shape[1] == 0:
+            return []
+        pad = self.window_frames - self._columns.shape[1]
+        floor = self._columns.min()
+        window = torch.cat([self._columns, floor.expand(N_MELS, pad)], dim=1)
+        return self._score([window], [self._total_frames])
+
+    def _score(self, windows: List[torch.Tensor], ends: List[int]) -> List[WindowScore]:
+        if not windows:
+            return []
+        batch = torch.stack(windows).unsqueeze(1)
+        mean = batch.mean(dim=(1, 2, 3), keepdim=True)
+        std = batch.std(dim=(1, 2, 3), keepdim=True)
+        batch = (batch - mean) / (std + 1e-5)
+        with torch.no_grad():
+            probs = torch.sigmoid(self.model(batch.to(self.device))).cpu().tolist()
+        seconds_per_frame = HOP_LENGTH / self.sample_rate
+        results = []
+        for prob, end in zip(probs, ends):
+            if self.call_score is None:
+                self.call_score = prob
+            else:
+                self.call_score = self.smoothing * prob + (1 - self.smoothing) * self.call_score
+            self.windows_scored += 1
+            start = max(end - self.window_frames, 0)
+            results.append(WindowScore(start * seconds_per_frame, end * seconds_per_frame, prob, self.call_score))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", type=Path, default=Path("../../ml/model/melcnn.pt"))
+    parser.add_argument("--audio", type=Path, required=True, help="Recording to replay as a stream")
+    parser.add_argument("--chunk-ms", type=float, default=20.0, help="Size of each simulated audio frame")
+    parser.add_argument("--hop", type=float, default=1.0, help="Seconds between window scores")
+    parser.add_argument("--smoothing", type=float, default=0.3, help="EMA weight of the newest window")
+    args = parser.parse_args()
+
+    model = load_checkpoint(args.checkpoint)
+    mono = audio_io.load(args.audio, SAMPLE_RATE)[0]
+    scorer = StreamingScorer(model, hop_seconds=args.hop, smoothing=args.smoothing)
+    chunk = max(1, int(SAMPLE_RATE * args.chunk_ms / 1000))
+    for start in range(0, len(mono), chunk):
+        for score in scorer.push(mono[start:start + chunk]):
+            print(f"{score.start:7.2f}-{score.end:7.2f}s  p(fake) {score.probability:.3f}  call {score.smoothed:.3f}")
+    for score in scorer.flush():
+        print(f"{score.start:7.2f}-{score.end:7.2f}s  p(fake) {score.probability:.3f}  call {score.smoothed:.3f}")
+    if scorer.call_score is None:
+        print("No complete window: the recording holds no audio")
+    else:
+        print(f"Call-level score: {scorer.call_score:.3f} over {scorer.windows_scored} windows")
+
+
+if __name__ == "__main__":
+    main()
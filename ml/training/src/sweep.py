@@ -0,0 +1,263 @@
+"""
+Hyperparameter sweeps over train.py options.
+
+Trials run concurrently in a process pool, each limited to a share of the CPU
+threads and each calling ``train.train`` in-process. The train/val log-mels
+are cached in feature stores before any trial starts, so trials only
+memory-map them: one store per distinct set of feature options (data
+directories, ``vad``, ``max-seconds``, ``bucketing``, ``val-crops``), shared by
+every trial that uses it. Trials are compared on validation EER, not
+loss: each trial's loss depends on its own criterion (focal vs BCE, gamma,
+label smoothing), so losses are on different scales. After a warm-up, a
+trial whose lowest EER so far is worse than the median of the other trials
+at the same epoch is pruned. Results are ranked by lowest EER into
+``results.csv`` / ``results.json``.
+
+    python sweep.py --grid lr=1e-5,3e-5,1e-4 loss=bce,focal use-specaugment=true,false \\
+        --concurrency 3 --out sweeps/lr-loss -- --train-data data/raw/train --val-data data/raw/dev --epochs 10
+
+Anything after ``--`` is passed to every trial as train.py options.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+SUMMARY_KEYS = ("best_val_loss", "best_val_acc", "best_val_eer", "best_epoch", "epochs")
+
+
+def parse_grid(specs: Sequence[str]) -> Dict[str, List[str]]:
+    """``["lr=1e-4,3e-4", "loss=bce,focal"]`` -> ``{"lr": [...], "loss": [...]}``."""
+    grid: Dict[str, List[str]] = {}
+    for spec in specs:
+        name, sep, values = spec.partition("=")
+        if not sep or not values:
+            raise ValueError(f"Expected name=value[,value...], got {spec!r}")
+        grid[name.strip().lstrip("-")] = [value.strip() for value in values.split(",")]
+    return grid
+
+
+def make_trials(grid: Dict[str, List[str]], limit: int | None, seed: int) -> List[Dict[str, str]]:
+    """Every grid combination, or ``limit`` of them sampled without replacement."""
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if limit and limit < len(combos):
+        combos = random.Random(seed).sample(combos, limit)
+    return combos
+
+
+def trial_argv(params: Dict[str, str]) -> List[str]:
+    """train.py options for ``params``; true/false values toggle store_true flags."""
+    argv: List[str] = []
+    for name, value in params.items():
+        if value.lower() in ("true", "false"):
+            if value.lower() == "true":
+                argv.append(f"--{name}")
+        else:
+            argv += [f"--{name}", value]
+    return argv
+
+
+class MedianPruner:
+    """Prune when the best-so-far EER is above the median of other trials at the same epoch."""
+
+    def __init__(self, history, warmup_epochs: int, min_trials: int):
+        self.history = history  # trial id -> best-so-far val EER per epoch (shared across processes)
+        self.warmup_epochs = warmup_epochs
+        self.min_trials = min_trials
+
+    def report(self, trial_id: int, epoch: int, val_eer: float | None) -> bool:
+        """Record ``val_eer`` (None when undefined); returns False if the trial should stop."""
+        curve = list(self.history.get(trial_id, []))
+        best = min([float("inf") if val_eer is None else val_eer] + curve[-1:])
+        curve.append(best)
+        self.history[trial_id] = curve
+        if epoch <= self.warmup_epochs:
+            return True
+        others = [other[epoch - 1] for tid, other in self.history.items() if tid != trial_id and len(other) >= epoch]
+        if len(others) < self.min_trials:
+            return True
+        return best <= statistics.median(others)
+
+
+def _limit_threads(threads: int) -> None:
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    import torch
+
+    torch.set_num_threads(threads)
+    with contextlib.suppress(RuntimeError):
+        torch.set_num_interop_threads(1)
+
+
+def run_trial(trial_id: int, params: Dict[str, str], base_argv: List[str], trial_dir: Path, pruner: MedianPruner,
+              ) -> Dict:
+    """Run one trial in this (worker) process; train.py output goes to ``trial_dir/train.log``."""
+    from train import build_parser, train
+
+    trial_dir.mkdir(parents=True, exist_ok=True)
+    argv = base_argv + trial_argv(params) + [
+        "--out", str(trial_dir), "--metrics-log", str(trial_dir / "metrics.jsonl"), "--keep-checkpoints", "1",
+    ]
+    result = {"trial": trial_id, "params": params, "status": "failed", "min_val_eer": None, "best_val_loss": None,
+              "best_val_acc": None, "best_val_eer": None, "best_epoch": None, "epochs": 0, "seconds": 0.0,
+              "error": None}
+    eers: List[float] = []
+
+    def on_epoch(record: Dict) -> bool:
+        if record["val_eer"] is not None:
+            eers.append(record["val_eer"])
+        return pruner.report(trial_id, record["epoch"], record["val_eer"])
+
+    started = time.perf_counter()
+    with (trial_dir / "train.log").open("w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            summary = train(build_parser().parse_args(argv), on_epoch=on_epoch)
+            result.update({k: summary[k] for k in SUMMARY_KEYS})
+            result["status"] = summary["stopped"] or "completed"
+        except Exception as exc:  # a broken trial must not take the sweep down
+            result["error"] = f"{type(exc).__name__}: {exc}"
+    result["min_val_eer"] = min(eers, default=None)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def feature_options(argv: List[str]) -> Dict:
+    """The train.py options that decide what goes into a trial's feature store."""
+    from dataset import SAMPLE_RATE
+    from train import build_parser
+
+    args = build_parser().parse_args(argv)
+    max_len = int(args.max_seconds * SAMPLE_RATE) if args.bucketing else None
+    val_max_len = int(args.max_seconds * SAMPLE_RATE) if args.bucketing or args.val_crops > 1 else None
+    return {
+        "train_data": str(args.train_data),
+        "val_data": str(args.val_data) if args.val_data and args.val_data.exists() else None,
+        "vad": args.vad,
+        "max_len": max_len,
+        "val_max_len": val_max_len,
+    }
+
+
+def feature_store_dir(store: Path, options: Dict) -> Path:
+    """Store of one feature-option set; trials with different options never share (or race on) a store."""
+    return store / hashlib.sha1(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def prepare_feature_store(options: Dict, store: Path) -> None:
+    """Build one train/val feature store, before trials memory-map it."""
+    from dataset import DeepfakeDataset
+
+    DeepfakeDataset(Path(options["train_data"]), augment=True, feature_store=store / "train", vad=options["vad"],
+                    max_len=options["max_len"])
+    if options["val_data"]:
+        DeepfakeDataset(Path(options["val_data"]), feature_store=store / "val", vad=options["vad"],
+                        max_len=options["val_max_len"])
+
+
+def write_results(results: List[Dict], out: Path) -> List[Dict]:
+    """Rank by lowest validation EER; losses of trials with different criteria are not comparable."""
+    ranked = sorted(results, key=lambda r: (r["min_val_eer"] is None, r["min_val_eer"] or 0.0))
+    for rank, result in enumerate(ranked, 1):
+        result["rank"] = rank
+    (out / "results.json").write_text(json.dumps(ranked, indent=2))
+    names = sorted({name for result in ranked for name in result["params"]})
+    with (out / "results.csv").open("w", encoding="utf-8", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["rank", "trial", *names, "status", "min_val_eer", "best_val_loss", "best_val_acc",
+                         "best_val_eer", "best_epoch", "epochs", "seconds"])
+        for r in ranked:
+            writer.writerow([r["rank"], r["trial"], *(r["params"].get(n, "") for n in names), r["status"],
+                             r["min_val_eer"], r["best_val_loss"], r["best_val_acc"], r["best_val_eer"],
+                             r["best_epoch"], r["epochs"], f"{r['seconds']:.1f}"])
+    return ranked
+
+
+def print_table(ranked: List[Dict]) -> None:
+    names = sorted({name for result in ranked for name in result["params"]})
+    header = ["#", "trial", *names, "status", "min_val_eer", "val_loss", "val_acc", "epochs"]
+    rows = [[str(r["rank"]), str(r["trial"]), *(r["params"].get(n, "") for n in names), r["status"],
+             f"{r['min_val_eer']:.2%}" if r["min_val_eer"] is not None else "-",
+             f"{r['best_val_loss']:.4f}" if r["best_val_loss"] is not None else "-",
+             f"{r['best_val_acc']:.3f}" if r["best_val_acc"] is not None else "-", str(r["epochs"])]
+            for r in ranked]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grid", nargs="+", required=True, help="name=v1,v2,... per train.py option")
+    parser.add_argument("--trials", type=int, default=None, help="Sample this many combinations (default: all)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Trials running at once")
+    parser.add_argument("--threads-per-trial", type=int, default=None,
+                        help="Torch/BLAS threads per trial (default: CPU count / concurrency)")
+    parser.add_argument("--out", type=Path, default=Path("sweeps/latest"))
+    parser.add_argument("--feature-store", type=Path, default=None,
+                        help="Root of the feature stores, one per feature-option set (default: <out>/features)")
+    parser.add_argument("--prune-warmup", type=int, default=2, help="Epochs before a trial can be pruned")
+    parser.add_argument("--prune-min-trials", type=int, default=2,
+                        help="Other trials that must have reached an epoch before pruning against it")
+    parser.add_argument("--seed", type=int, default=0)
+    args, base_argv = parser.parse_known_args()
+    if base_argv[:1] == ["--"]:
+        base_argv = base_argv[1:]
+
+    trials = make_trials(parse_grid(args.grid), args.trials, args.seed)
+    threads = args.threads_per_trial or max(1, (os.cpu_count() or 1) // args.concurrency)
+    store = args.feature_store or args.out / "features"
+    args.out.mkdir(parents=True, exist_ok=True)
+    if "--workers" not in base_argv:
+        base_argv += ["--workers", "0"]  # features come from the memory-mapped store
+    trial_argvs = []
+    stores: Dict[Path, Dict] = {}
+    for params in trials:
+        options = feature_options(base_argv + trial_argv(params))
+        trial_store = feature_store_dir(store, options)
+        stores[trial_store] = options
+        trial_argvs.append(base_argv + ["--feature-store", str(trial_store)])
+    print(f"{len(trials)} trials, {args.concurrency} at a time, {threads} threads each, "
+          f"{len(stores)} feature store(s)")
+    # Built here, one at a time; concurrent trials building the same store would race on its files
+    for trial_store, options in stores.items():
+        prepare_feature_store(options, trial_store)
+
+    ctx = mp.get_context("spawn")  # fresh interpreters: no inherited torch thread pools
+    with ctx.Manager() as manager:
+        pruner = MedianPruner(manager.dict(), args.prune_warmup, args.prune_min_trials)
+        results = []
+        with ProcessPoolExecutor(max_workers=args.concurrency, mp_context=ctx, initializer=_limit_threads,
+                                 initargs=(threads,)) as pool:
+            futures = [
+                pool.submit(run_trial, i, params, trial_argvs[i], args.out / f"trial-{i:03d}", pruner)
+                for i, params in enumerate(trials)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                eer = f"{result['min_val_eer']:.2%}" if result["min_val_eer"] is not None else "-"
+                print(f"trial {result['trial']:3d} {result['status']:14s} val_eer {eer} "
+                      f"after {result['epochs']} epochs ({result['seconds']:.0f}s) {result['params']}"
+                      + (f" {result['error']}" if result["error"] else ""))
+    print_table(write_results(results, args.out))
+    print(f"Results written to {args.out / 'results.csv'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,32 @@
 import argparse
+import os
+import time
+from contextlib import nullcontext
 from pathlib import Path
 
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.utils.data import DataLoader, random_split, WeightedRandomSampler
+from torch.distributed.algorithms.join import Join
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, Subset, WeightedRandomSampler
 from tqdm import tqdm
 import torchaudio
 
-from dataset import DeepfakeDataset
-from model import MelCNN
+from bucketing import LengthBucketBatchSampler
+from checkpoint import AsyncCheckpointer, capture_rng_state, latest_checkpoint, restore_rng_state
+from dataset import SAMPLE_RATE, BatchMelFeatures, DeepfakeDataset, frames_for, pad_collate
+from distributed import (
+    DistributedWeightedSampler, ShardSampler, all_reduce_sum, cleanup, gather_objects, init_distributed,
+    main_process_first,
+)
+from instrumentation import PHASES, MetricsLog, StepTimer, make_profiler
+from manifest import balanced_weights, split_indices
+from metrics import ScoreBuffer, attacks_for, summarize
+from models import VARIANTS, build_model, load_checkpoint
+from multicrop import AGGREGATIONS, aggregate_crops, crop_windows
+from shards import ShardedDataset
 
 
 class FocalLoss(nn.Module):
@@ -20,32 +37,122 @@ class FocalLoss(nn.Module):
         self.gamma = gamma
 
     def forward(self, logits, targets):
+        # Computed in fp32 even under autocast; (1 - pt) ** gamma underflows in half precision
+        logits = logits.float()
         bce = F.binary_cross_entropy_with_logits(logits, targets, reduction="none")
         pt = torch.exp(-bce)
         loss = self.alpha * (1 - pt) ** self.gamma * bce
         return loss.mean()
 
 
-def evaluate(model, loader, device, epoch, total_epochs, criterion):
+def distillation_loss(logits, teacher_logits, temperature: float = 2.0):
+    """
+    Binary KL divergence from the teacher's temperature-softened probabilities
+    to the student's, scaled by T^2 so its gradients match the hard loss.
+    """
+    student = logits.float() / temperature
+    teacher = teacher_logits.float() / temperature
+    p = torch.sigmoid(teacher)
+    kl = p * (F.logsigmoid(teacher) - F.logsigmoid(student)) + (1 - p) * (
+        F.logsigmoid(-teacher) - F.logsigmoid(-student)
+    )
+    return kl.mean() * temperature ** 2
+
+
+def loader_kwargs(args, device, iterable: bool = False):
+    """DataLoader worker/pinning options from the CLI, auto-detected where left unset."""
+    workers = args.workers
+    if workers is None:
+        workers = min(8, max((os.cpu_count() or 1) - 1, 0))
+    pin_memory = args.pin_memory if args.pin_memory is not None else device.type == "cuda"
+    kwargs = {"num_workers": workers, "pin_memory": pin_memory}
+    if workers > 0:
+        kwargs["prefetch_factor"] = args.prefetch_factor
+        # Persistent workers keep their own dataset copy, which would miss
+        # ShardedDataset.set_epoch() and replay the same shard order.
+        # Persistent workers also carry their RNG streams across epochs, so
+        # bit-exact --resume with workers needs --no-persistent-workers.
+        kwargs["persistent_workers"] = args.persistent_workers and not iterable
+    return kwargs
+
+
+def amp_dtype_for(device):
+    """bf16 autocast on CPU, fp16 (with GradScaler) on accelerators."""
+    return torch.bfloat16 if device.type == "cpu" else torch.float16
+
+
+def split_batch(batch):
+    """(inputs, labels, lengths) from a fixed-length batch (lengths None) or a ``pad_collate`` one."""
+    return batch[0], batch[1], batch[2] if len(batch) > 2 else None
+
+
+def dataset_durations(dataset):
+    """Clip durations in seconds, in dataset order (for length bucketing)."""
+    if isinstance(dataset, Subset):
+        return dataset_durations(dataset.dataset)[dataset.indices]
+    return dataset.durations()
+
+
+def dataset_paths(dataset):
+    """Clip paths in (unshuffled) loader order, or None for streamed shards."""
+    if isinstance(dataset, Subset):
+        paths = dataset_paths(dataset.dataset)
+        return None if paths is None else [paths[i] for i in dataset.indices]
+    if isinstance(dataset, DeepfakeDataset):
+        return [path for path, _ in dataset.items]
+    return None
+
+
+def evaluate(model, loader, device, epoch, total_epochs, criterion, features=None, amp_dtype=None,
+             channels_last=False, dist_ctx=None, crops=1, aggregate="logit"):
+    """
+    Mean loss plus every logit and label, in loader order (ranks concatenated
+    under ``dist_ctx``). Scores stay on the device until the loop ends, so
+    there is no host sync per batch. With ``crops`` > 1 (and a variable-length
+    loader) each clip is scored on up to ``crops`` windows of its log-mel,
+    aggregated with ``aggregate`` (see ``multicrop``).
+    """
     model.eval()
-    correct = total = 0
-    loss_sum = 0.0
+    try:
+        capacity = len(loader.sampler)
+    except TypeError:  # streamed shards: a guess, the buffer grows if needed
+        capacity = 4096
+    scores = ScoreBuffer(capacity, device)
     with torch.no_grad():
-        val_iter = tqdm(loader, desc=f"Epoch {epoch}/{total_epochs} [val]", leave=False)
-        for mel, label in val_iter:
-            mel, label = mel.to(device), label.to(device)
-            logits = model(mel)
-            loss = criterion(logits, label.float())
-            loss_sum += loss.item() * label.size(0)
-            preds = (torch.sigmoid(logits) > 0.5).long()
-            correct += (preds == label.long()).sum().item()
-            total += label.size(0)
-    avg_loss = loss_sum / max(total, 1)
-    avg_acc = correct / max(total, 1)
-    return avg_loss, avg_acc
+        show = dist_ctx is None or dist_ctx.is_main
+        val_iter = tqdm(loader, desc=f"Epoch {epoch}/{total_epochs} [val]", leave=False, disable=not show)
+        for batch in val_iter:
+            mel, label, lengths = split_batch(batch)
+            mel, label = mel.to(device, non_blocking=True), label.to(device, non_blocking=True)
+            if features is not None:
+                mel = features(mel, lengths=lengths)
+                lengths = frames_for(lengths) if lengths is not None else None
+            if crops > 1:
+                mel, lengths, owner = crop_windows(mel, lengths, crops)
+            if channels_last:
+                mel = mel.contiguous(memory_format=torch.channels_last)
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                logits = model(mel, lengths)
+                if crops > 1:
+                    logits = aggregate_crops(logits, owner, label.shape[0], aggregate)
+                loss = criterion(logits, label.float())
+            scores.add(logits.float(), label, loss.float())
+    logits, labels, loss_sum = scores.numpy()
+    # Length-bucketed batches visit clips sorted by duration; scores go back to dataset order
+    order = loader.batch_sampler.order() if isinstance(loader.batch_sampler, LengthBucketBatchSampler) else None
+    if dist_ctx is not None and dist_ctx.enabled:
+        parts = gather_objects(dist_ctx, (logits, labels, loss_sum, order))
+        logits = np.concatenate([part[0] for part in parts])
+        labels = np.concatenate([part[1] for part in parts])
+        loss_sum = sum(part[2] for part in parts)
+        order = np.concatenate([part[3] for part in parts]) if order is not None else None
+    if order is not None:
+        restore = np.argsort(order)
+        logits, labels = logits[restore], labels[restore]
+    return loss_sum / max(labels.size, 1), logits, labels
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("--train-data", type=Path, default=Path("data/raw/train"))
     parser.add_argument("--val-data", type=Path, default=Path("data/raw/dev"))
@@ -59,40 +166,228 @@ def main():
     parser.add_argument("--loss", choices=["bce", "focal"], default="focal")
     parser.add_argument("--focal-gamma", type=float, default=2.0)
     parser.add_argument("--out", type=Path, default=Path("../../ml/model"))
-    parser.add_argument("--resume", type=Path, default=None, help="Checkpoint to resume from")
+    parser.add_argument("--model", choices=list(VARIANTS), default="melcnn",
+                        help="Architecture (width-scaled / depthwise-separable MelCNN variants, see models/)")
+    parser.add_argument("--teacher", type=Path, default=None,
+                        help="Distil from this trained checkpoint (e.g. melcnn.pt) into the --model student")
+    parser.add_argument("--distill-alpha", type=float, default=0.5,
+                        help="Weight of the teacher's soft targets in the loss with --teacher")
+    parser.add_argument("--distill-temperature", type=float, default=2.0)
+    parser.add_argument("--resume", type=Path, default=None,
+                        help="Full checkpoint (or a directory of them; the newest is used) to continue exactly, "
+                             "or a melcnn.pt state_dict to start from its weights")
+    parser.add_argument("--checkpoint-dir", type=Path, default=None,
+                        help="Where per-epoch training-state checkpoints go (default: <out>/checkpoints)")
+    parser.add_argument("--keep-checkpoints", type=int, default=3, help="Rotating checkpoints to keep")
     parser.add_argument("--use-specaugment", action="store_true", help="Apply SpecAugment during training")
-    args = parser.parse_args()
+    parser.add_argument("--feature-store", type=Path, default=None,
+                        help="Cache log-mels in a memory-mapped store under this directory")
+    parser.add_argument("--batched-features", action="store_true",
+                        help="Load raw waveforms and compute augmentation/log-mels per batch on the training device")
+    parser.add_argument("--vad", action="store_true",
+                        help="Trim leading/trailing silence with the frame-energy VAD used by preprocess_audio.py")
+    parser.add_argument("--bucketing", action="store_true",
+                        help="Keep real clip lengths (up to --max-seconds) and batch clips of similar duration, "
+                             "with masked normalisation and pooling, instead of padding/cropping to 3 s")
+    parser.add_argument("--max-seconds", type=float, default=8.0,
+                        help="Longest clip (crop) with --bucketing, and longest validation clip with --val-crops")
+    parser.add_argument("--bucket-pool", type=int, default=50,
+                        help="Batches drawn per length-sorting pool with --bucketing")
+    parser.add_argument("--val-crops", type=int, default=1,
+                        help="Score each validation clip on up to this many overlapping 3 s windows of one "
+                             "full-clip log-mel (default: the single centre crop)")
+    parser.add_argument("--crop-aggregate", choices=AGGREGATIONS, default="logit",
+                        help="How --val-crops window scores are combined per clip")
+    parser.add_argument("--train-shards", type=Path, default=None,
+                        help="Stream training data from tar shards (split_asvspoof.py --format shards)")
+    parser.add_argument("--val-shards", type=Path, default=None, help="Stream validation data from tar shards")
+    parser.add_argument("--val-metadata", type=Path, default=None,
+                        help="ASVspoof protocol file for the validation clips; adds per-attack EER / t-DCF")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="DataLoader worker processes (default: CPU count - 1, capped at 8)")
+    parser.add_argument("--pin-memory", action=argparse.BooleanOptionalAction, default=None,
+                        help="Pin host batches for faster device copies (default: on for CUDA)")
+    parser.add_argument("--prefetch-factor", type=int, default=2, help="Batches prefetched per worker")
+    parser.add_argument("--persistent-workers", action=argparse.BooleanOptionalAction, default=True,
+                        help="Keep DataLoader workers alive between epochs")
+    parser.add_argument("--amp", action="store_true",
+                        help="Mixed precision: bf16 autocast on CPU, fp16 autocast + GradScaler on CUDA")
+    parser.add_argument("--channels-last", action="store_true", help="Run MelCNN in channels_last memory format")
+    parser.add_argument("--dist-backend", choices=["gloo", "nccl"], default=None,
+                        help="Process-group backend under torchrun (default: nccl on CUDA, gloo otherwise); "
+                             "--batch is per process")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Synchronised per-phase step timers (data/h2d/forward/backward/optimizer) and memory peaks")
+    parser.add_argument("--metrics-log", type=Path, default=None,
+                        help="Append per-epoch (and with --instrument, per-step) metrics to this JSONL file")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="Run torch.profiler over N training steps of the first epoch and write a Chrome trace")
+    parser.add_argument("--profile-trace", type=Path, default=None,
+                        help="Chrome trace path for --profile (default: <out>/profile_trace.json)")
+    return parser
 
-    train_dataset = DeepfakeDataset(args.train_data, augment=True)
 
-    # Class counts and sampler for imbalance
-    pos = sum(1 for _, lbl in train_dataset.items if lbl == 1)
-    neg = len(train_dataset) - pos
-    sample_weights = torch.tensor([neg if lbl == 1 else pos for _, lbl in train_dataset.items], dtype=torch.double)
-    sampler = WeightedRandomSampler(sample_weights, num_samples=len(sample_weights), replacement=True)
-    alpha = neg / max(pos + neg, 1)
+def validate_args(args) -> None:
+    """Raise ValueError for option combinations ``train`` cannot run."""
+    if args.batched_features and args.feature_store:
+        raise ValueError("--batched-features and --feature-store are mutually exclusive")
+    if args.feature_store and (args.train_shards or args.val_shards):
+        raise ValueError("--feature-store cannot be combined with shard datasets")
+    if args.bucketing and (args.train_shards or args.val_shards):
+        raise ValueError("--bucketing needs per-clip lengths and cannot be combined with shard datasets")
+    if args.teacher is not None and not args.teacher.exists():
+        raise ValueError(f"--teacher {args.teacher} does not exist")
+    if not 0.0 <= args.distill_alpha <= 1.0:
+        raise ValueError("--distill-alpha must be between 0 and 1")
+    if args.val_crops < 1:
+        raise ValueError("--val-crops must be at least 1")
+    if args.val_crops > 1 and args.val_shards:
+        raise ValueError("--val-crops needs whole validation clips and cannot be combined with --val-shards")
+    if args.train_shards and not args.val_shards and not (args.val_data and args.val_data.exists()):
+        raise ValueError("--train-shards needs --val-shards or an existing --val-data directory")
+
+
+def train(args, on_epoch=None):
+    """
+    Train MelCNN with parsed ``build_parser()`` options.
+
+    ``on_epoch`` is called with each epoch's metrics dict on rank 0 and may
+    return False to stop the run (used by ``sweep.py`` for pruning). Returns
+    a summary with the best validation loss/accuracy, epochs run and why the
+    run stopped.
+    """
+    validate_args(args)
+    dist_ctx = init_distributed(args.dist_backend)
+    device = dist_ctx.device
+    log = print if dist_ctx.is_main else (lambda *_, **__: None)
+    rank_kwargs = {"rank": dist_ctx.rank, "world_size": dist_ctx.world_size}
 
-    if args.val_data and args.val_data.exists():
-        print(f"Using validation data at {args.val_data}")
-        val_dataset = DeepfakeDataset(args.val_data)
+    train_store = args.feature_store / "train" if args.feature_store else None
+    val_store = args.feature_store / "val" if args.feature_store else None
+    max_len = int(args.max_seconds * SAMPLE_RATE) if args.bucketing else None
+    # Multi-crop validation cuts its windows from whole (variable-length) clips
+    val_max_len = int(args.max_seconds * SAMPLE_RATE) if args.bucketing or args.val_crops > 1 else None
+    if args.train_shards:
+        # Class balance comes from the shard reader instead of a sampler
+        train_dataset = ShardedDataset(
+            args.train_shards, augment=True, balance=True, raw_waveform=args.batched_features, vad=args.vad,
+            **rank_kwargs,
+        )
+        neg, pos = train_dataset.class_counts()
+        train_labels = None
     else:
+        with main_process_first(dist_ctx):
+            train_dataset = DeepfakeDataset(
+                args.train_data, augment=True, feature_store=train_store, raw_waveform=args.batched_features,
+                vad=args.vad, max_len=max_len,
+            )
+        train_labels = train_dataset.labels
+
+    if args.val_shards:
+        log(f"Using validation shards at {args.val_shards}")
+        val_dataset = ShardedDataset(args.val_shards, raw_waveform=args.batched_features, vad=args.vad, **rank_kwargs)
+    elif args.val_data and args.val_data.exists():
+        log(f"Using validation data at {args.val_data}")
+        with main_process_first(dist_ctx):
+            val_dataset = DeepfakeDataset(
+                args.val_data, feature_store=val_store, raw_waveform=args.batched_features, vad=args.vad,
+                max_len=val_max_len,
+            )
+    else:
+        if val_max_len != max_len:
+            raise ValueError("--val-crops needs a separate --val-data directory (or --bucketing)")
         val_ratio = min(max(args.val_split, 0.01), 0.5)
-        val_len = max(int(len(train_dataset) * val_ratio), 1)
-        train_len = len(train_dataset) - val_len
-        if train_len <= 0:
+        train_idx, val_idx = split_indices(len(train_dataset), val_ratio)
+        if len(train_idx) == 0:
             raise ValueError("Training dataset too small for requested validation split")
-        train_dataset, val_dataset = random_split(train_dataset, [train_len, val_len])
-        print(f"No explicit validation data found; using random split ({val_len} samples).")
+        val_dataset = Subset(train_dataset, val_idx)
+        train_dataset = Subset(train_dataset, train_idx)
+        train_labels = train_labels[train_idx]
+        log(f"No explicit validation data found; using random split ({len(val_idx)} samples).")
 
-    train_loader = DataLoader(train_dataset, batch_size=args.batch, sampler=sampler)
-    val_loader = DataLoader(val_dataset, batch_size=args.batch)
+    sampler = None
+    if train_labels is not None:
+        # Class counts and sampler for imbalance, over the rows actually trained on
+        neg, pos = (int(n) for n in np.bincount(train_labels, minlength=2)[:2])
+        sample_weights = torch.from_numpy(balanced_weights(train_labels))
+        if dist_ctx.enabled:
+            # Same global draw on every rank, each keeping its own stride of it
+            sampler = DistributedWeightedSampler(sample_weights, len(sample_weights), **rank_kwargs)
+        else:
+            sampler = WeightedRandomSampler(sample_weights, num_samples=len(sample_weights), replacement=True)
+    alpha = neg / max(pos + neg, 1)
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = MelCNN().to(device)
-    if args.resume and args.resume.exists():
-        print(f"Resuming from {args.resume}")
-        state = torch.load(args.resume, map_location=device)
+    val_sampler = None
+    if dist_ctx.enabled and not isinstance(val_dataset, ShardedDataset):
+        val_sampler = ShardSampler(len(val_dataset), **rank_kwargs)
+    if args.bucketing:
+        # Same class-balanced draw, regrouped so each batch holds clips of similar length
+        train_loader = DataLoader(
+            train_dataset, collate_fn=pad_collate, **loader_kwargs(args, device),
+            batch_sampler=LengthBucketBatchSampler(
+                sampler, dataset_durations(train_dataset), args.batch, args.bucket_pool,
+            ),
+        )
+    else:
+        train_loader = DataLoader(
+            train_dataset, batch_size=args.batch, sampler=sampler,
+            **loader_kwargs(args, device, iterable=isinstance(train_dataset, ShardedDataset)),
+        )
+    if val_max_len is not None:
+        val_loader = DataLoader(
+            val_dataset, collate_fn=pad_collate, **loader_kwargs(args, device),
+            batch_sampler=LengthBucketBatchSampler(
+                val_sampler or range(len(val_dataset)), dataset_durations(val_dataset), args.batch,
+                pool_batches=None, shuffle=False,
+            ),
+        )
+    else:
+        val_loader = DataLoader(
+            val_dataset, batch_size=args.batch, sampler=val_sampler,
+            **loader_kwargs(args, device, iterable=isinstance(val_dataset, ShardedDataset)),
+        )
+    val_paths = dataset_paths(val_dataset)
+    val_attacks = None
+    if args.val_metadata:
+        if val_paths is None:
+            log("--val-metadata needs per-clip paths; streamed validation shards get no per-attack breakdown")
+        else:
+            val_attacks = attacks_for(val_paths, args.val_metadata)
+    log(f"DataLoader: {loader_kwargs(args, device)}")
+    if args.val_crops > 1:
+        log(f"Validation: up to {args.val_crops} crops per clip, {args.crop_aggregate} aggregation")
+    if dist_ctx.enabled:
+        log(f"Distributed: {dist_ctx.world_size} processes, "
+            f"{args.batch * dist_ctx.world_size} samples per global step")
+    model = build_model(args.model).to(device)
+    log(f"Model: {args.model} ({sum(p.numel() for p in model.parameters()):,} parameters)")
+    teacher = None
+    if args.teacher is not None:
+        # Frozen and in eval mode (BatchNorm statistics, no dropout); never wrapped in DDP or checkpointed
+        teacher = load_checkpoint(args.teacher, map_location=device).to(device).requires_grad_(False)
+        log(f"Distilling from {args.teacher} (alpha {args.distill_alpha:g}, T {args.distill_temperature:g})")
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        if teacher is not None:
+            teacher = teacher.to(memory_format=torch.channels_last)
+    amp_dtype = amp_dtype_for(device) if args.amp else None
+    scaler = torch.amp.GradScaler(device.type, enabled=args.amp and amp_dtype == torch.float16)
+    if args.amp:
+        log(f"Mixed precision enabled ({amp_dtype})")
+    features = BatchMelFeatures().to(device) if args.batched_features else None
+    resume_state = None
+    resume_path = latest_checkpoint(args.resume) if args.resume and args.resume.exists() else None
+    if resume_path is not None:
+        log(f"Resuming from {resume_path}")
+        state = torch.load(resume_path, map_location=device, weights_only=False)
+        if "optimizer" in state:
+            resume_state = state
+            state = state["model"]
         model.load_state_dict(state)
+    # ``net`` runs the steps; ``model`` keeps the plain state_dict keys for saving
+    net = model
+    if dist_ctx.enabled:
+        net = DistributedDataParallel(model, device_ids=[device.index] if device.type == "cuda" else None)
 
     if args.loss == "focal":
         criterion = FocalLoss(alpha=alpha, gamma=args.focal_gamma)
@@ -111,44 +406,201 @@ def main():
     args.out.mkdir(parents=True, exist_ok=True)
     best_val_loss = float("inf")
     epochs_no_improve = 0
+    start_epoch = 1
+    if resume_state is not None:
+        optim.load_state_dict(resume_state["optimizer"])
+        scheduler.load_state_dict(resume_state["scheduler"])
+        scaler.load_state_dict(resume_state["scaler"])
+        best_val_loss = resume_state["best_val_loss"]
+        epochs_no_improve = resume_state["epochs_no_improve"]
+        start_epoch = resume_state["epoch"] + 1
+        if resume_state["finished"]:
+            log(f"Checkpoint is from a finished run (epoch {resume_state['epoch']}); nothing to resume")
+            start_epoch = args.epochs + 1
+    summary = {"best_val_loss": best_val_loss, "best_val_acc": None, "best_val_eer": None, "best_epoch": None,
+               "epochs": 0, "stopped": None}
+    timer = StepTimer(device, sync=args.instrument)
+    checkpointer = AsyncCheckpointer(args.checkpoint_dir or args.out / "checkpoints", keep=args.keep_checkpoints)
+    metrics = MetricsLog(args.metrics_log if dist_ctx.is_main else None)
+    # Closed even when a run fails (sweep.py catches trial errors and carries on)
+    try:
+        metrics.write("config", **{k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()})
+        profiler = None
+        if args.profile > 0 and dist_ctx.is_main:
+            profiler = make_profiler(args.profile, args.profile_trace or args.out / "profile_trace.json", device)
+            profiler.start()
+        if resume_state is not None:
+            # Last, so nothing during setup consumes the restored streams
+            rng_states = resume_state["rng"]
+            restore_rng_state(rng_states[dist_ctx.rank] if len(rng_states) == dist_ctx.world_size else rng_states[0])
 
-    for epoch in range(1, args.epochs + 1):
-        model.train()
-        train_loss_sum = 0.0
-        train_total = 0
-        train_iter = tqdm(train_loader, desc=f"Epoch {epoch}/{args.epochs} [train]", leave=False)
-        for mel, label in train_iter:
-            mel, label = mel.to(device), label.float().to(device)
-            if spec_aug:
-                mel = spec_aug(mel)
-            optim.zero_grad()
-            logits = model(mel)
-
-            if args.label_smoothing > 0:
-                label = label * (1 - args.label_smoothing) + 0.5 * args.label_smoothing
-
-            loss = criterion(logits, label)
-            loss.backward()
-            optim.step()
-            train_loss_sum += loss.item() * label.size(0)
-            train_total += label.size(0)
-            train_iter.set_postfix(loss=f"{loss.item():.4f}")
-
-        val_loss, val_acc = evaluate(model, val_loader, device, epoch, args.epochs, criterion)
-        scheduler.step()
-        train_loss = train_loss_sum / max(train_total, 1)
-        print(f"Epoch {epoch}: train_loss {train_loss:.4f} val_loss {val_loss:.4f} val_acc {val_acc:.3f}")
-
-        if val_loss < best_val_loss:
-            best_val_loss = val_loss
-            torch.save(model.state_dict(), args.out / "melcnn.pt")
-            print("Saved new checkpoint")
-            epochs_no_improve = 0
-        else:
-            epochs_no_improve += 1
-            if epochs_no_improve >= args.patience:
-                print(f"No improvement for {args.patience} epochs. Early stopping at epoch {epoch}.")
+        for epoch in range(start_epoch, args.epochs + 1):
+            if isinstance(train_dataset, ShardedDataset):
+                train_dataset.set_epoch(epoch)
+            if isinstance(train_loader.batch_sampler, LengthBucketBatchSampler):
+                train_loader.batch_sampler.set_epoch(epoch)  # also reseeds the sampler it wraps
+            elif isinstance(sampler, DistributedWeightedSampler):
+                sampler.set_epoch(epoch)
+            net.train()
+            train_loss_sum = 0.0
+            train_total = 0
+            train_iter = tqdm(train_loader, desc=f"Epoch {epoch}/{args.epochs} [train]", leave=False,
+                              disable=not dist_ctx.is_main)
+            epoch_start = time.perf_counter()
+            timer.reset()
+            # Shards split whole across ranks can leave them with unequal step counts;
+            # Join keeps DDP's gradient all-reduce from waiting on a finished rank.
+            uneven = dist_ctx.enabled and isinstance(train_dataset, ShardedDataset)
+            with Join([net]) if uneven else nullcontext():
+                for batch in train_iter:
+                    timer.lap("data")
+                    mel, label, lengths = split_batch(batch)
+                    mel, label = mel.to(device, non_blocking=True), label.float().to(device, non_blocking=True)
+                    timer.lap("h2d")
+                    if features is not None:
+                        mel = features(mel, augment=True, lengths=lengths)
+                        lengths = frames_for(lengths) if lengths is not None else None
+                    if spec_aug:
+                        mel = spec_aug(mel)
+                    if args.channels_last:
+                        mel = mel.contiguous(memory_format=torch.channels_last)
+                    optim.zero_grad(set_to_none=True)
+
+                    if args.label_smoothing > 0:
+                        label = label * (1 - args.label_smoothing) + 0.5 * args.label_smoothing
+
+                    with torch.autocast(device.type, dtype=amp_dtype, enabled=args.amp):
+                        logits = net(mel, lengths)
+                        loss = criterion(logits, label)
+                        if teacher is not None:
+                            with torch.no_grad():
+                                teacher_logits = teacher(mel, lengths)
+                            loss = (1 - args.distill_alpha) * loss + args.distill_alpha * distillation_loss(
+                                logits, teacher_logits, args.distill_temperature
+                            )
+                    timer.lap("forward")
+                    scaler.scale(loss).backward()
+                    timer.lap("backward")
+                    scaler.step(optim)
+                    scaler.update()
+                    # loss.item() synchronises, so the step total covers device work even without --instrument
+                    step_loss = loss.item()
+                    timer.lap("optimizer")
+                    train_loss_sum += step_loss * label.size(0)
+                    train_total += label.size(0)
+                    train_iter.set_postfix(loss=f"{step_loss:.4f}")
+                    step_times = timer.end_step(label.size(0))
+                    if args.instrument:
+                        metrics.write("step", epoch=epoch, step=timer.steps, loss=step_loss, **step_times)
+                    if profiler is not None:
+                        profiler.step()
+                        if timer.steps >= args.profile + 2:
+                            profiler.stop()
+                            profiler = None
+
+            train_seconds = time.perf_counter() - epoch_start
+            if profiler is not None:
+                # Epoch ended before the profiling window filled; write what was recorded
+                profiler.stop()
+                profiler = None
+            step_summary = timer.summary()
+            lr = optim.param_groups[0]["lr"]
+            val_loss, val_logits, val_labels = evaluate(
+                model, val_loader, device, epoch, args.epochs, criterion, features, amp_dtype, args.channels_last,
+                dist_ctx, args.val_crops, args.crop_aggregate,
+            )
+            report = summarize(val_logits, val_labels, val_attacks)
+            val_acc, val_eer = report["accuracy"] or 0.0, report["eer"]
+            scheduler.step()
+            train_loss_sum, train_total = all_reduce_sum(dist_ctx, train_loss_sum, train_total)
+            train_loss = train_loss_sum / max(train_total, 1)
+            log(f"Epoch {epoch}: train_loss {train_loss:.4f} val_loss {val_loss:.4f} val_acc {val_acc:.3f} "
+                f"val_eer {f'{val_eer:.2%}' if val_eer is not None else '-'} "
+                f"({train_total / max(train_seconds, 1e-9):.1f} samples/s)")
+            if report.get("per_attack"):
+                log("  EER by attack: " + "  ".join(
+                    f"{attack} {row['eer']:.2%}" for attack, row in report["per_attack"].items()
+                ))
+            data_time, compute_time = timer.data_seconds, timer.compute_seconds
+            wait_share = data_time / max(data_time + compute_time, 1e-9)
+            log(f"  data wait {data_time:.1f}s ({wait_share:.0%}) compute {compute_time:.1f}s"
+                + (" - input pipeline is starving the model" if wait_share > 0.5 else ""))
+            if args.instrument:
+                log("  per step: " + "  ".join(
+                    f"{phase} {step_summary.get(f'{phase}_ms_per_step', 0.0):.1f}ms" for phase in PHASES
+                ))
+                memory = [f"peak RSS {step_summary['peak_rss_mb']:.0f} MB"] if "peak_rss_mb" in step_summary else []
+                if "cuda_peak_allocated_mb" in step_summary:
+                    memory.append(f"CUDA peak {step_summary['cuda_peak_allocated_mb']:.0f} MB allocated")
+                if memory:
+                    log("  " + ", ".join(memory))
+            metrics.write("epoch", epoch=epoch, train_loss=train_loss, val_loss=val_loss, val_acc=val_acc,
+                          val_eer=val_eer, val_min_dcf=report["min_dcf"], val_min_tdcf=report["min_tdcf"],
+                          val_auc=report["roc_auc"], val_per_attack=report.get("per_attack"),
+                          lr=lr, wall_s=train_seconds, **step_summary)
+            metrics.flush()
+
+            stop = False
+            summary["epochs"] = epoch
+            if val_loss < best_val_loss:
+                best_val_loss = val_loss
+                summary.update(best_val_loss=val_loss, best_val_acc=val_acc, best_val_eer=val_eer, best_epoch=epoch)
+                if dist_ctx.is_main:
+                    checkpointer.save(model.state_dict(), args.out / "melcnn.pt")
+                    # Scores behind the best checkpoint, for `python metrics.py <out>/val_scores.npz`
+                    np.savez(args.out / "val_scores.npz", logits=val_logits, labels=val_labels,
+                             **({"paths": np.array([str(p) for p in val_paths])} if val_paths is not None else {}),
+                             **({"attacks": val_attacks} if val_attacks is not None else {}))
+                log("Saved new checkpoint")
+                epochs_no_improve = 0
+            else:
+                epochs_no_improve += 1
+                if epochs_no_improve >= args.patience:
+                    log(f"No improvement for {args.patience} epochs. Early stopping at epoch {epoch}.")
+                    stop = True
+                    summary["stopped"] = "early_stopping"
+            if on_epoch is not None and not stop:
+                keep_going = on_epoch({"epoch": epoch, "train_loss": train_loss, "val_loss": val_loss,
+                                       "val_acc": val_acc, "val_eer": val_eer}) if dist_ctx.is_main else True
+                # Rank 0 decides; the others follow so no rank is left waiting in a collective
+                if all_reduce_sum(dist_ctx, 0.0 if keep_going is not False else 1.0)[0] > 0:
+                    log(f"Pruned at epoch {epoch}")
+                    stop = True
+                    summary["stopped"] = "pruned"
+
+            # Every rank's RNG goes into the checkpoint so each resumes its own augmentation stream
+            rng_states = gather_objects(dist_ctx, capture_rng_state())
+            if dist_ctx.is_main:
+                checkpointer.save_epoch({
+                    "epoch": epoch,
+                    "model": model.state_dict(),
+                    "optimizer": optim.state_dict(),
+                    "scheduler": scheduler.state_dict(),
+                    "scaler": scaler.state_dict(),
+                    "best_val_loss": best_val_loss,
+                    "epochs_no_improve": epochs_no_improve,
+                    "finished": stop or epoch == args.epochs,
+                    "rng": rng_states,
+                }, epoch)
+            if stop:
                 break
+    finally:
+        try:
+            checkpointer.close()
+        finally:
+            metrics.close()
+    cleanup(dist_ctx)
+    return summary
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    try:
+        validate_args(args)
+    except ValueError as exc:
+        parser.error(str(exc))
+    train(args)
 
 
 if __name__ == "__main__":
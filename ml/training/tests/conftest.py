@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The training modules are flat scripts under src/, imported as ``from dataset import ...``
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
@@ -0,0 +1,16 @@
+import pytest
+import torch
+
+from models.compact import build_model
+from optimize_inference import fuse_melcnn
+
+
+@pytest.mark.parametrize("variant", ["melcnn", "ds-melcnn-0.5"])
+def test_fused_model_scripts(variant):
+    model = build_model(variant).eval()
+    scripted = torch.jit.script(fuse_melcnn(model))
+    mel = torch.randn(3, 1, 64, 188)
+    lengths = torch.tensor([188, 100, 40])
+    with torch.no_grad():
+        assert torch.allclose(scripted(mel), model(mel), atol=1e-5)
+        assert torch.allclose(scripted(mel, lengths), model(mel, lengths), atol=1e-5)
@@ -0,0 +1,15 @@
+from protocol import parse_metadata
+
+
+def test_parse_2019_lines(tmp_path):
+    metadata = tmp_path / "protocol.txt"
+    metadata.write_text(
+        "LA_0079 LA_T_1138215 - - bonafide\n"
+        "LA_0079 LA_T_1271820 - A01 spoof\n"
+        "# comment\n"
+        "T_0000000001 bonafide\n"
+    )
+    entries = list(parse_metadata(metadata))
+    assert entries[0] == {"utt_id": "LA_T_1138215", "label": "bonafide", "attack": "-"}
+    assert entries[1] == {"utt_id": "LA_T_1271820", "label": "spoof", "attack": "A01"}
+    assert entries[2] == {"utt_id": "T_0000000001", "label": "bonafide", "attack": "-"}
@@ -0,0 +1,22 @@
+from sweep import MedianPruner, write_results
+
+
+def test_pruner_compares_eer_and_tolerates_missing():
+    pruner = MedianPruner({}, warmup_epochs=1, min_trials=2)
+    for trial_id, eer in enumerate([0.10, 0.20]):
+        pruner.report(trial_id, 1, eer)
+        pruner.report(trial_id, 2, eer)
+    assert pruner.report(2, 1, None)
+    assert not pruner.report(2, 2, 0.30)
+    assert pruner.report(3, 1, 0.40) and pruner.report(3, 2, 0.05)
+
+
+def test_results_ranked_by_eer_not_loss(tmp_path):
+    base = {"params": {}, "status": "completed", "best_val_acc": None, "best_val_eer": None, "best_epoch": 1,
+            "epochs": 1, "seconds": 0.0}
+    results = [
+        dict(base, trial=0, min_val_eer=0.2, best_val_loss=0.05),  # focal: small loss scale
+        dict(base, trial=1, min_val_eer=0.1, best_val_loss=0.40),
+        dict(base, trial=2, min_val_eer=None, best_val_loss=None, status="failed"),
+    ]
+    assert [r["trial"] for r in write_results(results, tmp_path)] == [1, 0, 2]